@@ -9,11 +9,16 @@ sys.path.append('/Users/aniketpatole/Documents/GitHub/New/Projects/BigData/Assig
 
 # Import your functions
 from Airflow.scripts.docling_parser import (
-    list_pdfs_in_s3_folder,
-    process_pdf_and_upload,
-    create_index_for_pdf,
+    PIPELINE_VERSION,
+    get_s3_client,
+    s3_bucket_name,
+    s3_manifest_key,
+    list_pdf_objects_in_s3_folder,
+    convert_pdfs_in_parallel,
+    ensure_shared_index,
     generate_and_store_embeddings
 )
+from Airflow.scripts.ingestion_manifest import IngestionManifest
 
 # Default arguments
 default_args = {
@@ -36,51 +41,74 @@ with DAG(
     catchup=False,
 ) as dag:
 
-    # Process PDFs task
+    def load_manifest():
+        return IngestionManifest(get_s3_client(), s3_bucket_name, s3_manifest_key, PIPELINE_VERSION).load()
+
+    def list_pending_pdfs(manifest):
+        """Lists only the PDFs that are new or changed since the last successful ingestion."""
+        return manifest.pending(list_pdf_objects_in_s3_folder())
+
+    # Process PDFs task: the only stage that runs Docling. Returns one artifact per
+    # converted PDF, which Airflow pushes to XCom for the downstream tasks.
     def process_pdfs():
         try:
             logging.info("Starting to process PDFs...")
-            pdf_files = list_pdfs_in_s3_folder()
-            logging.info(f"Found {len(pdf_files)} PDF files.")
-            for pdf_key in pdf_files:
-                logging.info(f"Processing PDF: {pdf_key}")
-                process_pdf_and_upload(pdf_key)
-            logging.info("Completed processing PDFs.")
+            pdf_objects = list_pending_pdfs(load_manifest())
+            logging.info(f"Found {len(pdf_objects)} new or modified PDF files.")
+            results = convert_pdfs_in_parallel([pdf_object["Key"] for pdf_object in pdf_objects])
+            artifacts = []
+            for pdf_object, result in zip(pdf_objects, results):
+                if result["error"]:
+                    logging.warning(f"Conversion failed for {pdf_object['Key']} ({result['error']}); "
+                                    f"skipping downstream stages.")
+                    continue
+                artifacts.append({
+                    "Key": pdf_object["Key"],
+                    "ETag": pdf_object["ETag"],
+                    "Size": pdf_object["Size"],
+                    "pdf_name": result["pdf_name"],
+                    "md_s3_key": result["md_s3_key"],
+                })
+            logging.info(f"Completed processing PDFs; {len(artifacts)} converted.")
+            return artifacts
         except Exception as e:
             logging.error(f"Error during PDF processing: {e}")
             raise
 
-    # Upload metadata task
-    def upload_metadata():
+    # Upload metadata task: makes sure the shared index exists for the converted PDFs
+    def upload_metadata(ti):
         try:
             logging.info("Starting metadata upload...")
-            pdf_files = list_pdfs_in_s3_folder()
-            for pdf_key in pdf_files:
-                logging.info(f"Uploading metadata for PDF: {pdf_key}")
-                pdf_name, md_s3_key = process_pdf_and_upload(pdf_key)
-                if not pdf_name or not md_s3_key:
-                    logging.warning(f"Metadata upload skipped for {pdf_key}")
+            artifacts = ti.xcom_pull(task_ids="process_pdfs_task") or []
+            index_name = ensure_shared_index() if artifacts else None
+            for artifact in artifacts:
+                logging.info(f"Assigning PDF {artifact['Key']} to index {index_name}")
+                artifact["index_name"] = index_name
             logging.info("Completed metadata upload.")
+            return artifacts
         except Exception as e:
             logging.error(f"Error during metadata upload: {e}")
             raise
 
-    # Generate embeddings task
-    def generate_embeddings():
+    # Generate embeddings task: consumes the markdown produced by process_pdfs_task
+    def generate_embeddings(ti):
         try:
             logging.info("Starting to generate embeddings...")
-            pdf_files = list_pdfs_in_s3_folder()
-            logging.info(f"Found {len(pdf_files)} PDF files for embedding generation.")
-            for pdf_key in pdf_files:
-                logging.info(f"Processing embeddings for PDF: {pdf_key}")
-                pdf_name, md_s3_key = process_pdf_and_upload(pdf_key)
-                if pdf_name and md_s3_key:
-                    index_name = create_index_for_pdf(pdf_name)
-                    logging.info(f"Index created: {index_name} for PDF: {pdf_name}")
-                    generate_and_store_embeddings(index_name, pdf_name, md_s3_key)
-                    logging.info(f"Successfully generated embeddings for {pdf_name}.")
-                else:
-                    logging.warning(f"Skipping embeddings for {pdf_key} due to missing metadata.")
+            artifacts = ti.xcom_pull(task_ids="upload_metadata_task") or []
+            logging.info(f"Found {len(artifacts)} converted PDF files for embedding generation.")
+            manifest = load_manifest()
+            for artifact in artifacts:
+                pdf_name, md_s3_key, index_name = artifact["pdf_name"], artifact["md_s3_key"], artifact["index_name"]
+                logging.info(f"Processing embeddings for PDF: {artifact['Key']}")
+                result = generate_and_store_embeddings(index_name, pdf_name, md_s3_key)
+                if result["stored"] < result["chunks"]:
+                    logging.warning(f"Only {result['stored']}/{result['chunks']} chunks stored for {pdf_name}; "
+                                    f"it will be retried on the next run.")
+                    continue
+                logging.info(f"Successfully generated embeddings for {pdf_name}.")
+                # Persist after every document so a failed run keeps its progress
+                manifest.record(artifact, pdf_name=pdf_name, md_s3_key=md_s3_key, index_name=index_name)
+                manifest.save()
             logging.info("Completed embedding generation.")
         except Exception as e:
             logging.error(f"Error during embedding generation: {e}")
@@ -0,0 +1,120 @@
+import json
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Keeps tickers, acronyms and hyphenated identifiers (e.g. "ESG", "10-K", "SFDR", "BRK.B") intact
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_.][a-z0-9]+)*")
+
+# Files making up one document's BM25 index. vocab.json comes last: it is
+# uploaded last, and readers key their local copy on its ETag.
+BM25_FILES = ("postings_docs.npy", "postings_tfs.npy", "doc_lengths.npy", "chunks.json", "vocab.json")
+
+# S3 user-metadata key tagging every file of one upload with the same version,
+# so readers can tell a complete index from files of two ingestions
+BM25_VERSION_METADATA = "bm25-version"
+
+
+def tokenize(text):
+    """Lowercases text and splits it into BM25 terms."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def bm25_prefix(pdf_name):
+    """Returns the S3 prefix holding a document's BM25 index files."""
+    return f"{pdf_name}/bm25/"
+
+
+class BM25Builder:
+    """Accumulates one document's chunks and writes a compact, memory-mappable inverted index.
+
+    Postings for every term are stored contiguously in two flat arrays (chunk ids
+    as int32, term frequencies as uint16); vocab.json maps each term to its
+    [offset, document frequency] slice of those arrays.
+    """
+
+    def __init__(self):
+        self._postings = defaultdict(list)
+        self._doc_lengths = []
+        self._chunks = []
+
+    def add(self, text, chunk_metadata):
+        """Indexes one chunk; chunk ids are assigned in insertion order."""
+        chunk_id = len(self._doc_lengths)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            self._postings[term].append((chunk_id, min(tf, 65535)))
+        self._doc_lengths.append(len(terms))
+        self._chunks.append(chunk_metadata)
+        return chunk_id
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def write(self, directory):
+        """Writes the index files into directory and returns their paths."""
+        os.makedirs(directory, exist_ok=True)
+        vocab = {}
+        total = sum(len(postings) for postings in self._postings.values())
+        docs = np.empty(total, dtype=np.int32)
+        tfs = np.empty(total, dtype=np.uint16)
+        offset = 0
+        for term in sorted(self._postings):
+            postings = self._postings[term]
+            vocab[term] = [offset, len(postings)]
+            for position, (chunk_id, tf) in enumerate(postings, start=offset):
+                docs[position] = chunk_id
+                tfs[position] = tf
+            offset += len(postings)
+
+        np.save(os.path.join(directory, "postings_docs.npy"), docs)
+        np.save(os.path.join(directory, "postings_tfs.npy"), tfs)
+        np.save(os.path.join(directory, "doc_lengths.npy"), np.asarray(self._doc_lengths, dtype=np.int32))
+        with open(os.path.join(directory, "vocab.json"), "w") as fp:
+            json.dump(vocab, fp)
+        with open(os.path.join(directory, "chunks.json"), "w") as fp:
+            json.dump(self._chunks, fp)
+        return [os.path.join(directory, name) for name in BM25_FILES]
+
+
+class BM25Index:
+    """Read-only BM25 index over one document's chunks, with postings memory-mapped from disk."""
+
+    def __init__(self, directory, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(directory, "vocab.json")) as fp:
+            self.vocab = json.load(fp)
+        with open(os.path.join(directory, "chunks.json")) as fp:
+            self.chunks = json.load(fp)
+        self.docs = np.load(os.path.join(directory, "postings_docs.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(directory, "postings_tfs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(directory, "doc_lengths.npy"))
+        self.n_chunks = len(self.doc_lengths)
+        self.avg_length = float(self.doc_lengths.mean()) if self.n_chunks else 0.0
+        # Per-chunk length normalisation term, precomputed once
+        self._norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_length, 1e-9))
+
+    def search(self, query, top_k=10):
+        """Returns [(chunk_id, score)] for the top_k chunks by BM25 score, best first."""
+        if not self.n_chunks:
+            return []
+        scores = np.zeros(self.n_chunks, dtype=np.float32)
+        for term in set(tokenize(query)):
+            entry = self.vocab.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            chunk_ids = self.docs[offset:offset + df]
+            tf = self.tfs[offset:offset + df].astype(np.float32)
+            idf = np.log(1 + (self.n_chunks - df + 0.5) / (df + 0.5))
+            scores[chunk_ids] += idf * tf * (self.k1 + 1) / (tf + self._norm[chunk_ids])
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top_k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        top = top[np.argsort(-scores[top])]
+        return [(int(chunk_id), float(scores[chunk_id])) for chunk_id in top]
@@ -0,0 +1,75 @@
+import json
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# S3 user-metadata key holding the version of the shard an object was written as
+SHARD_VERSION_METADATA = "shard-version"
+
+
+def shard_prefix(pdf_name):
+    """Returns the S3 prefix under which every version of a document's chunk shard is stored."""
+    return f"{pdf_name}/chunks/"
+
+
+def shard_keys(pdf_name, version):
+    """Returns the S3 keys of one version of a document's packed chunk shard and its offset index.
+
+    Each ingestion writes new keys, so vectors of the previous ingestion keep
+    reading the shard they point into until they are replaced.
+    """
+    prefix = shard_prefix(pdf_name)
+    return f"{prefix}{version}.jsonl", f"{prefix}{version}.index.json"
+
+
+def delete_old_shards(s3_client, bucket, pdf_name, version):
+    """Deletes every shard of a document other than the given version; returns the number of objects removed."""
+    current = set(shard_keys(pdf_name, version))
+    stale = []
+    paginator = s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=shard_prefix(pdf_name)):
+        stale.extend(item["Key"] for item in page.get("Contents", []) if item["Key"] not in current)
+    for start in range(0, len(stale), 1000):
+        s3_client.delete_objects(Bucket=bucket, Delete={
+            "Objects": [{"Key": key} for key in stale[start:start + 1000]], "Quiet": True})
+    return len(stale)
+
+
+class ShardWriter:
+    """Packs every chunk of one document into a single JSONL shard with a byte-offset index.
+
+    Each chunk becomes one line; its (offset, length) locate that line so readers
+    can fetch it with a single ranged GET. Every write of a shard gets a fresh
+    version, stored on the S3 object and in each chunk's vector metadata, so
+    readers can tell offsets of one ingestion from the bytes of another.
+    """
+
+    def __init__(self, path, version=None):
+        self.path = path
+        self.version = version or uuid.uuid4().hex
+        self.index = {}
+        self._file = open(path, "wb")
+        self._offset = 0
+
+    def append(self, chunk_id, text, **fields):
+        """Writes one chunk and returns its (offset, length) in the shard."""
+        line = (json.dumps({"id": chunk_id, "text": text, **fields}, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = self._offset
+        self._file.write(line)
+        self._offset += len(line)
+        self.index[chunk_id] = [offset, len(line)]
+        return offset, len(line)
+
+    def close(self):
+        self._file.close()
+
+    def upload(self, s3_client, bucket, shard_key, index_key):
+        """Closes the shard and uploads it (multipart when large) along with its index."""
+        self.close()
+        metadata = {SHARD_VERSION_METADATA: self.version}
+        s3_client.upload_file(self.path, bucket, shard_key,
+                              ExtraArgs={"ContentType": "application/x-ndjson", "Metadata": metadata})
+        s3_client.put_object(Bucket=bucket, Key=index_key, Body=json.dumps(self.index).encode("utf-8"),
+                             ContentType="application/json", Metadata=metadata)
+        logger.info(f"Uploaded shard {shard_key} with {len(self.index)} chunks ({self._offset} bytes)")
@@ -1,17 +1,27 @@
+import time
+_import_started = time.perf_counter()
+
 import logging
+import multiprocessing
 import os
+import signal
 import tempfile
-import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from dotenv import load_dotenv
-import boto3
-from pinecone import Pinecone, ServerlessSpec
-from docling_core.types.doc import ImageRefMode, PictureItem, TableItem
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.datamodel.base_models import InputFormat
-from sentence_transformers import SentenceTransformer
 import hashlib
+import io
+from Airflow.scripts.chunk_shards import ShardWriter, delete_old_shards, shard_keys
+from Airflow.scripts.markdown_chunker import iter_markdown_chunks, page_marker
+from Airflow.scripts.s3_catalog import S3Catalog
+
+# boto3, Pinecone, Docling and sentence-transformers (torch) are imported inside
+# the accessors below. The Airflow scheduler imports this module on every DAG
+# parse, so nothing heavy may load at import time.
 
 
 # Initialize the logger
@@ -29,70 +39,214 @@ aws_secret_key = os.getenv("AWS_SECRET_ACCESS_KEY")
 aws_region = os.getenv("AWS_DEFAULT_REGION")
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_env = os.getenv("PINECONE_ENV")
-
-# Initialize AWS S3 client
-logger.info("Initializing S3 client...")
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=aws_access_key,
-    aws_secret_access_key=aws_secret_key,
-    region_name=aws_region
+# Every document lives in this one index, partitioned by its pdf_name metadata
+shared_index_name = os.getenv("PINECONE_INDEX_NAME", "documents-index")
+# Where vectors are written; must match the Streamlit app's VECTOR_BACKEND. "pinecone",
+# or a local backend ("local", "hnsw", "int8", "pq") stored under LOCAL_INDEX_DIR
+vector_backend = os.getenv("VECTOR_BACKEND", "pinecone")
+local_index_dir = os.path.expanduser(os.getenv("LOCAL_INDEX_DIR", "~/.cache/multi-agent-doc-search/indexes"))
+embedding_dimension = int(os.getenv("EMBEDDING_DIMENSION", 384))
+
+# Bump whenever conversion, chunking or embedding output changes so the
+# ingestion manifest treats previously ingested PDFs as stale
+PIPELINE_VERSION = os.getenv("PIPELINE_VERSION", "8")
+s3_manifest_key = os.getenv("S3_MANIFEST_KEY", "manifests/ingestion_manifest.json")
+
+# Embedding throughput tuning
+embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+upsert_batch_size = int(os.getenv("UPSERT_BATCH_SIZE", 100))
+upsert_concurrency = int(os.getenv("UPSERT_CONCURRENCY", 4))
+
+# Local embedding cache, shared across runs and documents
+embedding_model_name = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-MiniLM-L3-v2")
+embedding_cache_path = os.path.expanduser(
+    os.getenv("EMBEDDING_CACHE_PATH", "~/.cache/multi-agent-doc-search/embeddings.sqlite")
 )
 
-# Initialize Pinecone client
-logger.info("Initializing Pinecone client...")
-pinecone_client = Pinecone(api_key=pinecone_api_key)
-
-# Load the SentenceTransformer model
-model = SentenceTransformer('paraphrase-MiniLM-L3-v2')
+# Chunking: token budget per chunk (capped at the model's input limit) and overlap
+chunk_token_size = int(os.getenv("CHUNK_TOKENS", 256))
+chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", 24))
+
+# How figures end up in the markdown: "referenced" uploads each image once as its
+# own content-addressed S3 object and links it; "embedded" inlines base64 (legacy)
+image_export_mode = os.getenv("IMAGE_EXPORT_MODE", "referenced")
+s3_image_prefix = os.getenv("S3_IMAGE_PREFIX", "images/")
+image_placeholder = "<!-- image -->"
+
+# Parallel conversion tuning
+conversion_workers = int(os.getenv("CONVERSION_WORKERS", os.cpu_count() or 1))
+conversion_timeout = int(os.getenv("CONVERSION_TIMEOUT_SECONDS", 900))
+# Extra seconds the parent waits past the in-worker timeout before killing a hung worker
+conversion_kill_grace = int(os.getenv("CONVERSION_KILL_GRACE_SECONDS", 30))
+
+def create_s3_client():
+    """Creates an S3 client from the configured credentials."""
+    import boto3
+    return boto3.client(
+        's3',
+        aws_access_key_id=aws_access_key,
+        aws_secret_access_key=aws_secret_key,
+        region_name=aws_region
+    )
+
+# Lazily initialized, process-wide resources
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """Returns the shared S3 client, creating it on first use."""
+    logger.info("Initializing S3 client...")
+    return create_s3_client()
+
+@lru_cache(maxsize=None)
+def get_catalog():
+    """Returns the shared S3 catalog."""
+    return S3Catalog(get_s3_client(), s3_bucket_name)
+
+@lru_cache(maxsize=None)
+def get_pinecone_client():
+    """Returns the shared Pinecone client, creating it on first use."""
+    from pinecone import Pinecone
+    logger.info("Initializing Pinecone client...")
+    return Pinecone(api_key=pinecone_api_key)
+
+@lru_cache(maxsize=None)
+def get_vector_index(index_name):
+    """Returns the index ingestion writes to: a Pinecone index, or the local index the Streamlit app reads."""
+    if vector_backend == "pinecone":
+        return get_pinecone_client().Index(index_name)
+    from Streamlit.local_vector_index import open_local_index
+    return open_local_index(os.path.join(local_index_dir, vector_backend, index_name), vector_backend,
+                            embedding_dimension)
+
+@lru_cache(maxsize=None)
+def get_embedding_model():
+    """Returns the SentenceTransformer model, loading it on first use."""
+    from sentence_transformers import SentenceTransformer
+    logger.info(f"Loading SentenceTransformer model {embedding_model_name}...")
+    return SentenceTransformer(embedding_model_name)
+
+@lru_cache(maxsize=None)
+def get_embedding_cache():
+    """Returns the local embedding cache, opening it on first use."""
+    from Airflow.scripts.embedding_cache import EmbeddingCache
+    return EmbeddingCache(embedding_cache_path, embedding_model_name)
 
 # Utility Functions
 def sanitize_name(name):
     """Converts name to lowercase and replaces invalid characters with hyphens."""
     return name.lower().replace("_", "-").replace(" ", "-")
 
-def split_text_into_chunks(text, chunk_size=300):
-    """Splits text into smaller chunks of specified size."""
-    lines = text.splitlines()
-    chunks = []
-    current_chunk = []
-    current_length = 0
+def stream_text_chunks(md_file, chunk_tokens=None, overlap_tokens=None, with_attributes=False):
+    """Streams token-bounded, overlapping chunks that fit the embedding model's input limit."""
+    # [CLS] and [SEP] take two of the model's max_seq_length positions
+    model = get_embedding_model()
+    max_tokens = model.max_seq_length - 2
+    return iter_markdown_chunks(
+        md_file,
+        model.tokenizer,
+        chunk_tokens=chunk_tokens or chunk_token_size,
+        overlap_tokens=chunk_overlap_tokens if overlap_tokens is None else overlap_tokens,
+        max_tokens=max_tokens,
+        with_attributes=with_attributes,
+    )
+
+def encode_with_cache(chunks, chunk_hashes, encode_batch_size):
+    """Returns one embedding per chunk, encoding only chunks missing from the embedding cache."""
+    embedding_cache = get_embedding_cache()
+    cached = embedding_cache.get_many(chunk_hashes)
+    missing = {}
+    for chunk, chunk_hash in zip(chunks, chunk_hashes):
+        if chunk_hash not in cached:
+            missing.setdefault(chunk_hash, chunk)
+    if missing:
+        encoded = get_embedding_model().encode(list(missing.values()), batch_size=encode_batch_size, convert_to_numpy=True)
+        fresh = list(zip(missing.keys(), encoded))
+        embedding_cache.put_many(fresh)
+        cached.update(fresh)
+    return [cached[chunk_hash] for chunk_hash in chunk_hashes]
+
+def batched(items, batch_size):
+    """Yields successive lists of at most batch_size items from any iterable."""
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+def upsert_in_batches(vector_index, vectors, batch_size=None, max_workers=None):
+    """Upserts vectors in sized batches with bounded concurrency; returns the number stored.
+
+    vectors may be a generator; at most 2 * max_workers batches are held in memory.
+    """
+    batch_size = batch_size or upsert_batch_size
+    max_workers = max_workers or upsert_concurrency
+    stored = 0
+    in_flight = {}
+
+    def collect(done):
+        nonlocal stored
+        for future in done:
+            batch = in_flight.pop(future)
+            try:
+                future.result()
+                stored += len(batch)
+            except Exception as e:
+                logger.error(f"Failed to upsert batch starting at {batch[0]['id']}: {e}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch in batched(vectors, batch_size):
+            if len(in_flight) >= 2 * max_workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+            in_flight[executor.submit(vector_index.upsert, vectors=batch)] = batch
+        collect(as_completed(list(in_flight)))
+    return stored
+
+def list_pdf_objects_in_s3_folder(**filters):
+    """Streams PDF objects (Key, ETag, Size, LastModified) in the specified S3 folder, across all pages."""
+    logger.info(f"Listing PDFs in S3 folder: {s3_pdf_folder}")
+    return get_catalog().iter_pdfs(s3_pdf_folder, **filters)
+
+def list_pdfs_in_s3_folder():
+    """Lists PDF files in the specified S3 folder."""
+    return [item['Key'] for item in list_pdf_objects_in_s3_folder()]
 
-    for line in lines:
-        line_length = len(line.split())
-        if current_length + line_length > chunk_size:
-            chunks.append("\n".join(current_chunk))
-            current_chunk = []
-            current_length = 0
-        current_chunk.append(line)
-        current_length += line_length
+# Docling converter, built once per process and reused for every PDF it converts
+document_converter = None
 
-    if current_chunk:  # Add the last chunk
-        chunks.append("\n".join(current_chunk))
+class ConversionTimeout(BaseException):
+    """Raised inside a conversion worker when a PDF exceeds its time budget.
 
-    return chunks
+    A BaseException so the broad error handling around a conversion cannot swallow it.
+    """
 
-def list_pdfs_in_s3_folder():
-    """Lists PDF files in the specified S3 folder."""
-    logger.info(f"Listing PDFs in S3 folder: {s3_pdf_folder}")
-    response = s3.list_objects_v2(Bucket=s3_bucket_name, Prefix=s3_pdf_folder)
-    pdf_files = [item['Key'] for item in response.get('Contents', []) if item['Key'].endswith('.pdf')]
-    return pdf_files
+def get_document_converter():
+    """Returns this process's DocumentConverter, building it on first use."""
+    global document_converter
+    if document_converter is None:
+        from docling.datamodel.base_models import InputFormat
+        from docling.datamodel.pipeline_options import PdfPipelineOptions
+        from docling.document_converter import DocumentConverter, PdfFormatOption
+        logger.info("Initializing Docling DocumentConverter...")
+        pipeline_options = PdfPipelineOptions()
+        pipeline_options.images_scale = 2.0
+        pipeline_options.generate_page_images = True
+        pipeline_options.generate_table_images = True
+        pipeline_options.generate_picture_images = True
+        document_converter = DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)})
+    return document_converter
 
 def process_pdf_and_upload(pdf_key):
     """Downloads a PDF from S3, extracts images and text, then uploads to S3."""
-    pdf_name = pdf_key.split('/')[-1].replace('.pdf', '')
+    # The catalog matches ".pdf" in any case; strip it the same way Streamlit's document_id does
+    pdf_name, extension = os.path.splitext(pdf_key.split('/')[-1])
+    if extension.lower() != '.pdf':
+        pdf_name += extension
     sanitized_pdf_name = sanitize_name(pdf_name)
     s3_output_folder = f"{sanitized_pdf_name}/"
     logger.info(f"Processing PDF: {pdf_key}")
 
     try:
-        pipeline_options = PdfPipelineOptions()
-        pipeline_options.images_scale = 2.0
-        pipeline_options.generate_page_images = True
-        pipeline_options.generate_table_images = True
-        pipeline_options.generate_picture_images = True
-        doc_converter = DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options)})
+        from docling_core.types.doc import ImageRefMode
+        doc_converter = get_document_converter()
+        s3 = get_s3_client()
 
         with tempfile.TemporaryDirectory() as tmp_dir:
             tmp_path = Path(tmp_dir)
@@ -105,7 +259,10 @@ def process_pdf_and_upload(pdf_key):
             conv_res = doc_converter.convert(local_pdf_path)
             logger.info("Saving images and markdown...")
 
-            content_md = conv_res.document.export_to_markdown(image_mode=ImageRefMode.EMBEDDED)
+            if image_export_mode == "embedded":
+                content_md = export_markdown(conv_res.document, image_mode=ImageRefMode.EMBEDDED)
+            else:
+                content_md = export_markdown_with_image_refs(conv_res.document)
             md_filename = output_dir / f"{sanitized_pdf_name}.md"
             with md_filename.open("w") as fp:
                 fp.write(content_md)
@@ -118,14 +275,206 @@ def process_pdf_and_upload(pdf_key):
         logger.error(f"Error processing PDF {pdf_key}: {e}")
     return None, None
 
-def create_index_for_pdf(pdf_name):
-    """Creates a Pinecone index for the PDF if it doesn't exist."""
-    index_name = f"{pdf_name.replace('_', '-').lower()}-index"
+# S3 image keys this process has already uploaded or seen
+uploaded_image_keys = set()
+
+def upload_image(image):
+    """Uploads a PIL image once under a content-addressed key and returns that key."""
+    from botocore.exceptions import ClientError
+    s3 = get_s3_client()
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    data = buffer.getvalue()
+    image_key = f"{s3_image_prefix}{hashlib.sha256(data).hexdigest()}.png"
+    if image_key in uploaded_image_keys:
+        return image_key
     try:
-        if index_name in [index.name for index in pinecone_client.list_indexes()]:
+        s3.head_object(Bucket=s3_bucket_name, Key=image_key)
+    except ClientError:
+        s3.put_object(Bucket=s3_bucket_name, Key=image_key, Body=data, ContentType="image/png")
+    uploaded_image_keys.add(image_key)
+    return image_key
+
+def export_markdown(document, **export_options):
+    """Exports markdown page by page, each page preceded by a marker the chunker turns into page metadata."""
+    pages = sorted(getattr(document, "pages", None) or {})
+    if not pages:
+        return document.export_to_markdown(**export_options)
+    try:
+        return "\n\n".join(f"{page_marker(page_no)}\n\n{document.export_to_markdown(page_no=page_no, **export_options)}"
+                           for page_no in pages)
+    except TypeError:
+        logger.warning("This docling-core cannot export single pages; chunks will carry no page numbers.")
+        return document.export_to_markdown(**export_options)
+
+def export_markdown_with_image_refs(document):
+    """Exports markdown with each picture stored as a separate S3 object and linked by key."""
+    from docling_core.types.doc import ImageRefMode, PictureItem
+    content_md = export_markdown(document, image_mode=ImageRefMode.PLACEHOLDER, image_placeholder=image_placeholder)
+    # Placeholders appear in the same order as the pictures in the document body
+    image_refs = []
+    for element, _level in document.iterate_items():
+        if isinstance(element, PictureItem):
+            image = element.get_image(document)
+            image_refs.append(f"![Image](s3://{s3_bucket_name}/{upload_image(image)})" if image else "")
+    parts = content_md.split(image_placeholder)
+    if len(parts) - 1 != len(image_refs):
+        logger.warning(f"Found {len(parts) - 1} image placeholders but {len(image_refs)} pictures; "
+                       f"unmatched placeholders are dropped.")
+    image_refs += [""] * max(0, len(parts) - 1 - len(image_refs))
+    return "".join(part + ref for part, ref in zip(parts, image_refs + [""]))
+
+def _init_conversion_worker(threads_per_worker):
+    """Process-pool initializer: fresh S3 client, bounded torch threads, warm converter."""
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    # Never share a boto3 client inherited from the parent process
+    get_s3_client.cache_clear()
+    get_catalog.cache_clear()
+    get_document_converter()
+
+def _raise_conversion_timeout(signum, frame):
+    raise ConversionTimeout()
+
+def _convert_pdf_in_worker(pdf_key, timeout):
+    """Converts one PDF inside a pool worker, aborting it if it runs past timeout seconds.
+
+    SIGALRM only interrupts Python code; the parent kills workers stuck in native code.
+    """
+    previous_handler = signal.signal(signal.SIGALRM, _raise_conversion_timeout)
+    signal.alarm(timeout)
+    start_time = time.perf_counter()
+    error = None
+    try:
+        pdf_name, md_s3_key = process_pdf_and_upload(pdf_key)
+        if not md_s3_key:
+            error = "conversion failed"
+    except ConversionTimeout:
+        pdf_name, md_s3_key = None, None
+        error = "timed out"
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous_handler)
+    return {"pdf_key": pdf_key, "pdf_name": pdf_name, "md_s3_key": md_s3_key,
+            "seconds": time.perf_counter() - start_time, "error": error}
+
+def _failed_conversion(pdf_key, error, seconds=0.0):
+    return {"pdf_key": pdf_key, "pdf_name": None, "md_s3_key": None, "seconds": seconds, "error": error}
+
+def _kill_pool(executor):
+    """Kills a process pool's workers outright; used when one is stuck past its deadline."""
+    # The executor keeps no public handle on its workers; without the private one,
+    # fall back to every multiprocessing child of this process
+    processes = getattr(executor, "_processes", None)
+    workers = list(processes.values()) if processes is not None else multiprocessing.active_children()
+    for process in workers:
+        process.kill()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def convert_pdfs_in_parallel(pdf_keys, max_workers=None, timeout=None):
+    """Converts PDFs on a process pool, one reused DocumentConverter per worker.
+
+    Each PDF gets its own time budget, and a failing or crashing document never
+    takes the rest of the batch down with it. At most max_workers PDFs are in
+    flight, so each one's deadline starts when a worker picks it up; a worker
+    still busy timeout + conversion_kill_grace seconds later is killed and the
+    pool recycled, with the other in-flight PDFs requeued. A worker crash breaks
+    the whole pool, so the PDFs in flight at the time are rerun one at a time
+    and only a PDF that crashes on its own is charged for it. Returns one
+    result dict per key, in input order.
+    """
+    max_workers = max(1, min(max_workers or conversion_workers, len(pdf_keys) or 1))
+    timeout = timeout or conversion_timeout
+    threads_per_worker = max(1, (os.cpu_count() or 1) // max_workers)
+    results = {}
+    pending = deque(pdf_keys)
+    retried = set()
+    isolated = set()
+    logger.info(f"Converting {len(pending)} PDFs with {max_workers} workers ({threads_per_worker} threads each)")
+
+    while pending:
+        executor = ProcessPoolExecutor(max_workers=max_workers, initializer=_init_conversion_worker,
+                                       initargs=(threads_per_worker,))
+        in_flight = {}
+        recycle = False
+        try:
+            while (pending or in_flight) and not recycle:
+                # A PDF suspected of crashing the pool runs alone, so a second crash is its own
+                alone = any(pdf_key in isolated for pdf_key, _ in in_flight.values())
+                while pending and len(in_flight) < max_workers and not alone:
+                    if pending[0] in isolated and in_flight:
+                        break
+                    pdf_key = pending.popleft()
+                    future = executor.submit(_convert_pdf_in_worker, pdf_key, timeout)
+                    in_flight[future] = (pdf_key, time.monotonic() + timeout + conversion_kill_grace)
+                    alone = pdf_key in isolated
+                next_deadline = min(deadline for _, deadline in in_flight.values())
+                done, _ = wait(in_flight, timeout=max(0.0, next_deadline - time.monotonic()),
+                               return_when=FIRST_COMPLETED)
+                crashed = []
+                for future in done:
+                    pdf_key, _ = in_flight.pop(future)
+                    try:
+                        results[pdf_key] = future.result()
+                    except BrokenProcessPool:
+                        crashed.append(pdf_key)
+                    except Exception as e:
+                        results[pdf_key] = _failed_conversion(pdf_key, str(e))
+                if crashed:
+                    # A worker died hard (e.g. a native crash), failing every PDF still in the pool
+                    recycle = True
+                    for future, (pdf_key, _) in list(in_flight.items()):
+                        if future.done() and not future.cancelled() and future.exception() is None:
+                            results[pdf_key] = future.result()
+                        else:
+                            crashed.append(pdf_key)
+                    in_flight.clear()
+                    if len(crashed) > 1:
+                        isolated.update(crashed)
+                        pending.extendleft(reversed(crashed))
+                    elif crashed[0] in retried or crashed[0] in isolated:
+                        results[crashed[0]] = _failed_conversion(crashed[0], "worker crashed")
+                    else:
+                        # Alone in the pool, but possibly a transient failure; retry it once in a fresh pool
+                        retried.add(crashed[0])
+                        pending.appendleft(crashed[0])
+                    continue
+                now = time.monotonic()
+                for future, (pdf_key, deadline) in list(in_flight.items()):
+                    if deadline <= now:
+                        del in_flight[future]
+                        results[pdf_key] = _failed_conversion(pdf_key, "timed out", timeout + conversion_kill_grace)
+                        recycle = True
+        finally:
+            if recycle:
+                # The PDFs that were sharing the pool did nothing wrong; run them again from the start
+                pending.extendleft(pdf_key for pdf_key, _ in reversed(list(in_flight.values())))
+                _kill_pool(executor)
+            else:
+                executor.shutdown()
+
+    failed = [result for result in results.values() if result["error"]]
+    for result in failed:
+        logger.error(f"Conversion of {result['pdf_key']} failed: {result['error']}")
+    logger.info(f"Converted {len(results) - len(failed)}/{len(results)} PDFs.")
+    return [results[pdf_key] for pdf_key in pdf_keys]
+
+def legacy_index_name(pdf_name):
+    """Returns the per-PDF index name used before all documents moved into the shared index."""
+    return f"{pdf_name.replace('_', '-').lower()}-index"
+
+def ensure_shared_index(index_name=None):
+    """Creates the shared multi-document Pinecone index if it doesn't exist; local indexes are created on open."""
+    index_name = index_name or shared_index_name
+    if vector_backend != "pinecone":
+        return index_name
+    from pinecone import ServerlessSpec
+    pinecone_client = get_pinecone_client()
+    try:
+        if index_name in pinecone_client.list_indexes().names():
             logger.info(f"Index {index_name} already exists. Skipping creation.")
         else:
-            logger.info(f"Creating Pinecone index for {pdf_name}")
+            logger.info(f"Creating shared Pinecone index {index_name}")
             pinecone_client.create_index(
                 name=index_name,
                 dimension=384,
@@ -136,47 +485,136 @@ def create_index_for_pdf(pdf_name):
         logger.error(f"Failed to create or verify index {index_name}: {e}")
     return index_name
 
-def generate_and_store_embeddings(index_name, pdf_name, md_s3_key):
-    """Generates embeddings from text chunks, stores metadata in S3, and references in Pinecone."""
-    logger.info(f"Generating and storing embeddings for {pdf_name} in Pinecone index: {index_name}")
+def delete_stale_vectors(vector_index, pdf_name, chunk_count):
+    """Deletes a document's vectors left over from an earlier ingestion that produced more chunks."""
+    try:
+        stale_ids = []
+        for id_page in vector_index.list(prefix=f"{pdf_name}_"):
+            for vector_id in id_page:
+                suffix = vector_id[len(pdf_name) + 1:]
+                if suffix.isdigit() and int(suffix) >= chunk_count:
+                    stale_ids.append(vector_id)
+        for id_batch in batched(stale_ids, 1000):
+            vector_index.delete(ids=id_batch)
+        if stale_ids:
+            logger.info(f"Deleted {len(stale_ids)} stale vectors for {pdf_name}")
+    except Exception as e:
+        logger.warning(f"Could not clean up stale vectors for {pdf_name}: {e}")
+
+def upload_bm25_index(bm25, pdf_name, local_dir, version):
+    """Writes a document's BM25 index and uploads its files; hybrid retrieval falls back to dense if missing."""
+    from Airflow.scripts.bm25_index import BM25_VERSION_METADATA, bm25_prefix
+    s3 = get_s3_client()
+    try:
+        for path in bm25.write(local_dir):
+            s3.upload_file(path, s3_bucket_name, f"{bm25_prefix(pdf_name)}{os.path.basename(path)}",
+                           ExtraArgs={"Metadata": {BM25_VERSION_METADATA: version}})
+        logger.info(f"Uploaded BM25 index for {pdf_name} ({len(bm25)} chunks)")
+    except Exception as e:
+        logger.error(f"Failed to upload BM25 index for {pdf_name}: {e}")
+
+def generate_and_store_embeddings(index_name, pdf_name, md_s3_key, encode_batch_size=None):
+    """Generates embeddings from text chunks, stores them in one S3 shard, and references in the vector index.
+
+    Chunk texts are packed into a single per-document JSONL shard; each vector's
+    metadata carries the shard key and version plus the byte offset and length of its chunk.
+    Every ingestion writes its shard under a new versioned key before any vector
+    is upserted, and earlier shards are deleted only once all vectors point at it,
+    so queries keep reading the previous ingestion meanwhile.
+    A BM25 inverted index over the same chunks is uploaded under {pdf_name}/bm25/
+    for hybrid retrieval. Metadata also records each chunk's page range, section,
+    element type and ingestion time so queries can filter on them.
+    """
+    from Airflow.scripts.bm25_index import BM25Builder
+    logger.info(f"Generating and storing embeddings for {pdf_name} in {vector_backend} index: {index_name}")
+    encode_batch_size = encode_batch_size or embedding_batch_size
+    chunk_count = 0
+    s3 = get_s3_client()
+    embedding_cache = get_embedding_cache()
+    embedding_cache.reset_stats()
+    bm25 = BM25Builder()
+    ingested_at = int(time.time())
+
+    def embed_chunks(md_file, shard, shard_key):
+        """Writes every chunk to the shard, encoding a batch of chunks per forward pass; returns their vectors."""
+        nonlocal chunk_count
+        vectors = []
+        for chunk_batch in batched(stream_text_chunks(md_file, with_attributes=True), encode_batch_size):
+            chunk_batch, attribute_batch = zip(*chunk_batch)
+            batch_start = chunk_count
+            chunk_count += len(chunk_batch)
+            chunk_hashes = [hashlib.md5(chunk.encode('utf-8')).hexdigest() for chunk in chunk_batch]
+            embeddings = encode_with_cache(chunk_batch, chunk_hashes, encode_batch_size)
+
+            for idx, (chunk, attributes, chunk_hash, embedding) in enumerate(
+                    zip(chunk_batch, attribute_batch, chunk_hashes, embeddings), start=batch_start):
+                vector_id = f"{pdf_name}_{idx}"
+                offset, length = shard.append(vector_id, chunk, chunk_hash=chunk_hash, **attributes)
+                metadata = {"s3_key": shard_key, "shard_version": shard.version, "pdf_name": pdf_name,
+                            "chunk_hash": chunk_hash, "offset": offset, "length": length,
+                            "ingested_at": ingested_at, **attributes}
+                bm25.add(chunk, {"id": vector_id, **metadata})
+                vectors.append((vector_id, embedding, metadata))
+        return vectors
 
     with tempfile.TemporaryDirectory() as tmp_dir:
         tmp_path = Path(tmp_dir) / f"{pdf_name}.md"
         s3.download_file(s3_bucket_name, md_s3_key, str(tmp_path))
+        vector_index = get_vector_index(index_name)
 
+        start_time = time.perf_counter()
+        shard = ShardWriter(str(Path(tmp_dir) / f"{pdf_name}.jsonl"))
+        shard_key, shard_index_key = shard_keys(pdf_name, shard.version)
         with open(tmp_path, 'r') as md_file:
-            text = md_file.read()
-
-        text_chunks = split_text_into_chunks(text)
-        pinecone_index = pinecone_client.Index(index_name)
-
-        for idx, chunk in enumerate(text_chunks):
-            embedding = model.encode(chunk, convert_to_tensor=False).tolist()
-
-            chunk_hash = hashlib.md5(chunk.encode('utf-8')).hexdigest()
-            s3_key = f"{pdf_name}/metadata/{chunk_hash}.txt"
-
+            vectors = embed_chunks(md_file, shard, shard_key)
+        try:
+            shard.upload(s3, s3_bucket_name, shard_key, shard_index_key)
+        except Exception as e:
+            # Nothing points at the new shard yet, so the previous ingestion stays fully readable
+            logger.error(f"Failed to upload chunk shard {shard_key}: {e}")
+            return {"chunks": chunk_count, "stored": 0, "seconds": time.perf_counter() - start_time,
+                    "chunks_per_second": 0.0, "embedding_cache": embedding_cache.stats()}
+
+        stored = upsert_in_batches(vector_index, (
+            {"id": vector_id, "values": embedding.tolist(), "metadata": metadata}
+            for vector_id, embedding, metadata in vectors))
+        if stored == chunk_count:
+            delete_stale_vectors(vector_index, pdf_name, chunk_count)
+        if vector_backend != "pinecone":
+            # Local indexes write to disk only on flush; once per document
+            vector_index.flush()
+        upload_bm25_index(bm25, pdf_name, str(Path(tmp_dir) / "bm25"), shard.version)
+        if stored == chunk_count:
+            # Older shards are unreferenced now; after a partial upsert some vectors still read them
             try:
-                s3.put_object(Bucket=s3_bucket_name, Key=s3_key, Body=chunk)
-                logger.info(f"Uploaded metadata for chunk {idx} to S3 with key: {s3_key}")
+                removed = delete_old_shards(s3, s3_bucket_name, pdf_name, shard.version)
+                if removed:
+                    logger.info(f"Deleted {removed} objects of earlier shards of {pdf_name}")
             except Exception as e:
-                logger.error(f"Failed to upload metadata for chunk {idx} to S3: {e}")
-                continue
-
-            metadata = {"s3_key": s3_key, "pdf_name": pdf_name}
-
-            try:
-                pinecone_index.upsert([{"id": f"{pdf_name}_{idx}", "values": embedding, "metadata": metadata}])
-                logger.info(f"Stored embedding for chunk {idx} of {pdf_name} in Pinecone index: {index_name}")
-            except Exception as e:
-                logger.error(f"Failed to store embedding for chunk {idx} of {pdf_name}: {e}")
+                logger.warning(f"Could not delete earlier shards of {pdf_name}: {e}")
+        total_seconds = time.perf_counter() - start_time
+
+        chunks_per_second = chunk_count / total_seconds if total_seconds > 0 else 0.0
+        logger.info(
+            f"Stored {stored}/{chunk_count} embeddings for {pdf_name} in {total_seconds:.2f}s "
+            f"({chunks_per_second:.1f} chunks/s, encode_batch_size={encode_batch_size}, "
+            f"upsert_batch_size={upsert_batch_size}, upsert_concurrency={upsert_concurrency})"
+        )
+        cache_stats = embedding_cache.stats()
+        logger.info(
+            f"Embedding cache for {pdf_name}: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.1%} hit rate)"
+        )
+        return {"chunks": chunk_count, "stored": stored, "seconds": total_seconds,
+                "chunks_per_second": chunks_per_second, "embedding_cache": cache_stats}
+
+logger.debug(f"Imported docling_parser in {(time.perf_counter() - _import_started) * 1000:.1f} ms")
 
 if __name__ == "__main__":
     pdf_files = list_pdfs_in_s3_folder()
 
-    for pdf_key in pdf_files:
-        pdf_name, md_s3_key = process_pdf_and_upload(pdf_key)
+    for result in convert_pdfs_in_parallel(pdf_files):
+        pdf_name, md_s3_key = result["pdf_name"], result["md_s3_key"]
 
         if pdf_name and md_s3_key:
-            index_name = create_index_for_pdf(pdf_name)
-            generate_and_store_embeddings(index_name, pdf_name, md_s3_key)
+            generate_and_store_embeddings(ensure_shared_index(), pdf_name, md_s3_key)
@@ -0,0 +1,79 @@
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by (model name, chunk hash), backed by SQLite.
+
+    Vectors are stored as raw float32 blobs, so a 384-dim embedding costs 1.5 KB.
+    Lookups and inserts are batched to keep one round trip per encode batch.
+    """
+
+    def __init__(self, path, model_name):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " chunk_hash TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, chunk_hash))"
+        )
+        self._connection.commit()
+
+    def get_many(self, chunk_hashes):
+        """Returns {chunk_hash: vector} for the hashes already cached, updating hit/miss counts."""
+        unique_hashes = list(dict.fromkeys(chunk_hashes))
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE model = ? AND chunk_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                )
+                for chunk_hash, blob in rows:
+                    found[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+            self.hits += sum(1 for chunk_hash in chunk_hashes if chunk_hash in found)
+            self.misses += sum(1 for chunk_hash in chunk_hashes if chunk_hash not in found)
+        return found
+
+    def put_many(self, items):
+        """Stores (chunk_hash, vector) pairs."""
+        rows = [(self.model_name, chunk_hash, np.asarray(vector, dtype=np.float32).tobytes())
+                for chunk_hash, vector in items]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector) VALUES (?, ?, ?)", rows
+            )
+            self._connection.commit()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Returns hit/miss counters for logging."""
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate}
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,70 @@
+import json
+import logging
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionManifest:
+    """Tracks which S3 PDFs have been ingested, keyed by S3 key, ETag/size and pipeline version."""
+
+    def __init__(self, s3_client, bucket, manifest_key, pipeline_version):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.manifest_key = manifest_key
+        self.pipeline_version = pipeline_version
+        self.entries = {}
+
+    def load(self):
+        """Loads the manifest from S3; a missing manifest starts empty."""
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self.manifest_key)
+            self.entries = json.loads(response["Body"].read().decode("utf-8")).get("documents", {})
+            logger.info(f"Loaded ingestion manifest with {len(self.entries)} entries from {self.manifest_key}")
+        except self.s3.exceptions.NoSuchKey:
+            logger.info(f"No ingestion manifest at {self.manifest_key}; starting fresh.")
+            self.entries = {}
+        return self
+
+    def save(self):
+        """Writes the manifest back to S3."""
+        body = json.dumps({"documents": self.entries}, indent=2, sort_keys=True)
+        self.s3.put_object(Bucket=self.bucket, Key=self.manifest_key, Body=body.encode("utf-8"),
+                           ContentType="application/json")
+        logger.info(f"Saved ingestion manifest with {len(self.entries)} entries to {self.manifest_key}")
+
+    @staticmethod
+    def fingerprint(s3_object):
+        """Returns the (etag, size) pair identifying one version of an S3 object."""
+        return s3_object["ETag"].strip('"'), int(s3_object["Size"])
+
+    def is_current(self, s3_object):
+        """True when the object was already ingested at this ETag, size and pipeline version."""
+        entry = self.entries.get(s3_object["Key"])
+        if not entry:
+            return False
+        etag, size = self.fingerprint(s3_object)
+        return (entry.get("etag") == etag and entry.get("size") == size
+                and entry.get("pipeline_version") == self.pipeline_version)
+
+    def pending(self, s3_objects):
+        """Filters listed S3 objects (any iterable) down to the new or modified ones."""
+        pending = []
+        listed = 0
+        for obj in s3_objects:
+            listed += 1
+            if not self.is_current(obj):
+                pending.append(obj)
+        logger.info(f"{len(pending)} of {listed} PDFs are new or modified.")
+        return pending
+
+    def record(self, s3_object, **artifacts):
+        """Marks an object as ingested, storing any artifact references alongside it."""
+        etag, size = self.fingerprint(s3_object)
+        self.entries[s3_object["Key"]] = {
+            "etag": etag,
+            "size": size,
+            "pipeline_version": self.pipeline_version,
+            "ingested_at": datetime.now(timezone.utc).isoformat(),
+            **artifacts,
+        }
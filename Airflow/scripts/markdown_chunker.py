@@ -0,0 +1,215 @@
+import logging
+import re
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Number of characters read from the markdown file at a time. Bounds memory
+# even for single-line payloads such as inlined base64 images.
+READ_SIZE = 64 * 1024
+
+# Token headroom kept when a piece has to be cut mid-word, since re-tokenizing
+# the tail of a split word can take a few more tokens than it did in place.
+MID_WORD_MARGIN = 4
+
+
+# Markdown image references, including inlined base64 data URIs. They carry no
+# text worth embedding, so the chunker drops them.
+IMAGE_REF = re.compile(r"!\[[^\]\n]*\]\([^)\s]*\)")
+DATA_URI_START = re.compile(r"!\[[^\]\n]*\]\(data:")
+
+# Page boundary markers written by the converter (see docling_parser.export_markdown)
+PAGE_MARKER = re.compile(r"^\s*<!-- page (\d+) -->\s*$")
+HEADING = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+MAX_SECTION_CHARS = 200
+
+
+def page_marker(page_no):
+    """Returns the marker line recording that the following markdown comes from page_no."""
+    return f"<!-- page {page_no} -->"
+
+
+def read_blocks(md_file):
+    """Yields the file line by line, splitting lines longer than READ_SIZE characters."""
+    while True:
+        block = md_file.readline(READ_SIZE)
+        if not block:
+            return
+        yield block
+
+
+def strip_image_payloads(blocks):
+    """Removes markdown image references from a block stream, even base64 payloads spanning blocks."""
+    skipping = False
+    for block in blocks:
+        if skipping:
+            end = block.find(")")
+            if end < 0:
+                continue
+            block = block[end + 1:]
+            skipping = False
+        block = IMAGE_REF.sub("", block)
+        match = DATA_URI_START.search(block)
+        if match:
+            # The data URI runs past this block; drop everything up to its closing parenthesis
+            block = block[:match.start()]
+            skipping = True
+        if block:
+            yield block
+
+
+def count_tokens(tokenizer, text):
+    """Counts the tokens text encodes to, excluding special tokens."""
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+def split_to_token_windows(tokenizer, text, limit):
+    """Splits text into contiguous pieces of at most limit tokens, cutting on word boundaries.
+
+    Yields (piece, n_tokens) pairs. A single word longer than limit is cut mid-word,
+    and pieces touching such a cut are recounted rather than trusted to the offsets.
+    """
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = encoding["offset_mapping"]
+    n_tokens = len(offsets)
+    if n_tokens <= limit:
+        yield text, n_tokens
+        return
+
+    word_ids = encoding.word_ids()
+    start_token, start_char, starts_mid_word = 0, 0, False
+    while n_tokens - start_token > limit:
+        cut = start_token + limit
+        while cut > start_token and word_ids[cut] == word_ids[cut - 1]:
+            cut -= 1
+        ends_mid_word = cut == start_token
+        if ends_mid_word:
+            cut = start_token + limit - MID_WORD_MARGIN
+        cut_char = offsets[cut][0]
+        piece = text[start_char:cut_char]
+        if starts_mid_word or ends_mid_word:
+            yield piece, count_tokens(tokenizer, piece)
+        else:
+            yield piece, cut - start_token
+        start_token, start_char, starts_mid_word = cut, cut_char, ends_mid_word
+
+    tail = text[start_char:]
+    yield tail, count_tokens(tokenizer, tail) if starts_mid_word else n_tokens - start_token
+
+
+def token_tail(tokenizer, text, limit):
+    """Returns the trailing words of text that fit in limit tokens, and their token count."""
+    encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    offsets = encoding["offset_mapping"]
+    word_ids = encoding.word_ids()
+    start = max(0, len(offsets) - limit)
+    while 0 < start < len(offsets) and word_ids[start] == word_ids[start - 1]:
+        start += 1
+    if start >= len(offsets):
+        return "", 0
+    return text[offsets[start][0]:], len(offsets) - start
+
+
+def chunk_attributes(window):
+    """Summarises where a chunk's pieces came from: page range, first section, element type."""
+    pages = [page for _, _, page, _, _ in window if page is not None]
+    sections = [section for _, _, _, section, _ in window if section]
+    kinds = {is_table for text, _, _, _, is_table in window if text.strip()}
+    attributes = {"element_type": "mixed" if len(kinds) > 1 else ("table" if True in kinds else "text")}
+    if pages:
+        attributes["page_start"], attributes["page_end"] = min(pages), max(pages)
+    if sections:
+        attributes["section"] = sections[0]
+    return attributes
+
+
+def iter_markdown_chunks(md_file, tokenizer, chunk_tokens, overlap_tokens=0, max_tokens=None, with_attributes=False):
+    """Streams token-bounded, overlapping chunks from an open markdown file.
+
+    Lines are packed into chunks of up to chunk_tokens tokens, as counted by the
+    embedding model's tokenizer. Lines longer than that are split on word
+    boundaries, leaving room for the overlap, and every chunk is recounted as
+    a whole before it is yielded, so no chunk exceeds max_tokens (the model's
+    input limit) and nothing is truncated at encode time. Consecutive chunks share up to overlap_tokens
+    tokens, cut from the end of the previous chunk on a word boundary. Image
+    references, including inlined base64 images, are skipped. Only one chunk
+    plus one read block is held in memory at a time.
+
+    Page markers are consumed rather than embedded. With with_attributes, yields
+    (chunk, attributes) pairs where attributes holds page_start/page_end (when
+    the markdown has page markers), the enclosing section heading and an
+    element_type of "text", "table" or "mixed".
+    """
+    max_tokens = max_tokens or chunk_tokens
+    chunk_tokens = min(chunk_tokens, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+
+    window = deque()
+    window_tokens = 0
+    # Entries at the front of the window carried over from the previous chunk
+    carried = 0
+    has_new = False
+    page, section = None, None
+
+    def emit():
+        """Returns the window's chunks: its text, split again if the joined text overshoots chunk_tokens."""
+        entries = list(window)
+        while True:
+            chunk = "".join(entry[0] for entry in entries).strip()
+            if not chunk:
+                return []
+            # Pieces were counted apart; joined, a word split across reads can tokenize longer
+            n_tokens = count_tokens(tokenizer, chunk)
+            if n_tokens <= chunk_tokens:
+                chunks = [chunk]
+                break
+            if len(entries) > len(window) - carried:
+                # Give up overlap before splitting new text
+                entries.pop(0)
+                continue
+            chunks = [piece.strip() for piece, _ in split_to_token_windows(tokenizer, chunk, chunk_tokens)]
+            break
+        attributes = chunk_attributes(window)
+        return [(chunk, attributes) if with_attributes else chunk for chunk in chunks if chunk]
+
+    def carry_overlap():
+        """Keeps the last overlap_tokens tokens of the window, cutting into a piece if needed."""
+        nonlocal window_tokens, carried
+        kept, kept_tokens = deque(), 0
+        while window and kept_tokens + window[-1][1] <= overlap_tokens:
+            entry = window.pop()
+            kept.appendleft(entry)
+            kept_tokens += entry[1]
+        if window and kept_tokens < overlap_tokens:
+            text, _, *origin = window[-1]
+            tail, n_tokens = token_tail(tokenizer, text, overlap_tokens - kept_tokens)
+            if n_tokens:
+                kept.appendleft((tail, n_tokens, *origin))
+                kept_tokens += n_tokens
+        window.clear()
+        window.extend(kept)
+        window_tokens, carried = kept_tokens, len(kept)
+
+    for block in strip_image_payloads(read_blocks(md_file)):
+        marker = PAGE_MARKER.match(block)
+        if marker:
+            page = int(marker.group(1))
+            continue
+        heading = HEADING.match(block)
+        if heading:
+            section = heading.group(1)[:MAX_SECTION_CHARS]
+        is_table = block.lstrip().startswith("|")
+        for piece, n_tokens in split_to_token_windows(tokenizer, block, chunk_tokens - overlap_tokens):
+            if window_tokens + n_tokens > chunk_tokens and has_new:
+                yield from emit()
+                carry_overlap()
+                has_new = False
+            while window and window_tokens + n_tokens > chunk_tokens:
+                window_tokens -= window.popleft()[1]
+                carried = max(0, carried - 1)
+            window.append((piece, n_tokens, page, section, is_table))
+            window_tokens += n_tokens
+            has_new = has_new or n_tokens > 0
+
+    if has_new:
+        yield from emit()
@@ -0,0 +1,93 @@
+"""Copies vectors from the old one-index-per-PDF layout into the shared multi-document index.
+
+Usage (from the repository root):
+
+    python -m Airflow.scripts.migrate_to_shared_index [--indexes a-index b-index] [--delete-legacy]
+
+Vectors keep their ids (already prefixed with the PDF name) and metadata, with
+pdf_name filled in from the legacy index name where it is missing, so every
+document stays queryable from the shared index straight away. Ingestion
+manifest entries are repointed at the shared index but keep their
+pipeline_version: migrated vectors still use the layout they were written with
+(no chunk shards or chunk attributes), so the next DAG run deliberately
+re-embeds them in the current format, replacing the copies by id.
+"""
+import argparse
+import logging
+
+from Airflow.scripts.docling_parser import (
+    PIPELINE_VERSION,
+    batched,
+    ensure_shared_index,
+    get_pinecone_client,
+    get_s3_client,
+    s3_bucket_name,
+    s3_manifest_key,
+    shared_index_name,
+    upsert_in_batches,
+)
+from Airflow.scripts.ingestion_manifest import IngestionManifest
+
+logger = logging.getLogger(__name__)
+
+FETCH_BATCH_SIZE = 200
+
+
+def find_legacy_indexes():
+    """Lists per-PDF indexes, identified by the legacy '-index' suffix."""
+    names = get_pinecone_client().list_indexes().names()
+    return [name for name in names if name.endswith("-index") and name != shared_index_name]
+
+
+def iter_legacy_vectors(legacy_index, pdf_name):
+    """Yields every vector of a legacy index as an upsert payload for the shared index."""
+    for id_page in legacy_index.list():
+        for id_batch in batched(id_page, FETCH_BATCH_SIZE):
+            fetched = legacy_index.fetch(ids=id_batch)
+            for vector_id, vector in fetched.vectors.items():
+                metadata = dict(vector.metadata or {})
+                metadata.setdefault("pdf_name", pdf_name)
+                yield {"id": vector_id, "values": vector.values, "metadata": metadata}
+
+
+def migrate(index_names, delete_legacy=False):
+    """Copies each legacy index into the shared index; returns {legacy index: vectors copied}."""
+    pinecone_client = get_pinecone_client()
+    shared_index = pinecone_client.Index(ensure_shared_index())
+    copied = {}
+    for index_name in index_names:
+        pdf_name = index_name[:-len("-index")]
+        logger.info(f"Migrating {index_name} into {shared_index_name} as pdf_name={pdf_name}")
+        copied[index_name] = upsert_in_batches(shared_index, iter_legacy_vectors(pinecone_client.Index(index_name), pdf_name))
+        logger.info(f"Copied {copied[index_name]} vectors from {index_name}")
+
+    manifest = IngestionManifest(get_s3_client(), s3_bucket_name, s3_manifest_key, PIPELINE_VERSION).load()
+    migrated = set(index_names)
+    outdated = 0
+    for entry in manifest.entries.values():
+        if entry.get("index_name") in migrated:
+            entry["index_name"] = shared_index_name
+            # The copied vectors are in the old layout; leave the version so the next run upgrades them
+            outdated += entry.get("pipeline_version") != PIPELINE_VERSION
+    manifest.save()
+    if outdated:
+        logger.info(f"{outdated} migrated PDFs predate pipeline version {PIPELINE_VERSION} "
+                    f"and will be re-embedded on the next run.")
+
+    if delete_legacy:
+        for index_name in index_names:
+            expected = pinecone_client.Index(index_name).describe_index_stats().total_vector_count
+            if copied[index_name] < expected:
+                logger.warning(f"Keeping {index_name}: copied {copied[index_name]} of {expected} vectors")
+                continue
+            logger.info(f"Deleting legacy index {index_name}")
+            pinecone_client.delete_index(index_name)
+    return copied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--indexes", nargs="*", help="Legacy indexes to migrate (default: every '*-index').")
+    parser.add_argument("--delete-legacy", action="store_true", help="Delete legacy indexes after copying.")
+    args = parser.parse_args()
+    migrate(args.indexes or find_legacy_indexes(), delete_legacy=args.delete_legacy)
@@ -0,0 +1,46 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class S3Catalog:
+    """Streams S3 object listings page by page, shared by the ingestion DAG and the Streamlit app.
+
+    list_objects_v2 returns at most 1000 keys per call; the paginator follows
+    continuation tokens so listings of any size work without holding them in memory.
+    """
+
+    def __init__(self, s3_client, bucket, page_size=1000):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.page_size = page_size
+
+    def iter_objects(self, prefix="", suffix=None, min_size=None, max_size=None,
+                     modified_since=None, start_after=None):
+        """Yields listed objects (Key, ETag, Size, LastModified) that match every given filter."""
+        paginator = self.s3.get_paginator("list_objects_v2")
+        pagination = {"Bucket": self.bucket, "Prefix": prefix,
+                      "PaginationConfig": {"PageSize": self.page_size}}
+        if start_after:
+            pagination["StartAfter"] = start_after
+        suffix = suffix.lower() if suffix else None
+
+        for page in paginator.paginate(**pagination):
+            for item in page.get("Contents", []):
+                if suffix and not item["Key"].lower().endswith(suffix):
+                    continue
+                if min_size is not None and item["Size"] < min_size:
+                    continue
+                if max_size is not None and item["Size"] > max_size:
+                    continue
+                if modified_since is not None and item["LastModified"] <= modified_since:
+                    continue
+                yield item
+
+    def iter_pdfs(self, prefix="", **filters):
+        """Yields PDF objects under prefix."""
+        return self.iter_objects(prefix, suffix=".pdf", **filters)
+
+    def changed_since(self, prefix, since, suffix=".pdf"):
+        """Yields objects under prefix modified after the timezone-aware datetime since."""
+        return self.iter_objects(prefix, suffix=suffix, modified_since=since)
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from jwtauth import get_current_user  # Import authentication dependency
+from response_cache import ResponseCache
 import sys
 import os
 
@@ -11,6 +12,18 @@ from arxiv_agent import ArxivAgent
 # Create a router for ArxivAgent API
 router = APIRouter(prefix="/arxiv", tags=["Arxiv"])
 
+# Search results shared by all users, keyed by normalized query and num_results
+arxiv_cache = ResponseCache("arxiv")
+
+async def cached_arxiv_search(query: str, num_results: int):
+    """Search Arxiv through the response cache; selected_document does not affect the results."""
+    async def fetch():
+        agent = ArxivAgent(selected_document="API request", user_query=query)
+        return await agent.asearch_arxiv(query, num_results=num_results)
+    # arXiv answers rate limiting and outages with an empty feed, so empty results are never cached
+    return await arxiv_cache.get_or_fetch(ResponseCache.make_key(query, num_results), fetch,
+                                          cacheable=lambda papers: bool(papers))
+
 # Pydantic model for the request body
 class ArxivRequest(BaseModel):
     selected_document: str
@@ -18,24 +31,19 @@ class ArxivRequest(BaseModel):
     num_results: int = 10
 
 @router.get("/search")
-def search_arxiv_get(query: str, num_results: int = 10, current_user: dict = Depends(get_current_user)):
+async def search_arxiv_get(query: str, num_results: int = 10, current_user: dict = Depends(get_current_user)):
     """GET endpoint to search Arxiv with a user query."""
     try:
-        agent = ArxivAgent(selected_document="GET request", user_query=query)
-        results = agent.search_arxiv(query, num_results=num_results)
+        results = await cached_arxiv_search(query, num_results)
         return {"status": "success", "data": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/search")
-def search_arxiv_post(request: ArxivRequest, current_user: dict = Depends(get_current_user)):
+async def search_arxiv_post(request: ArxivRequest, current_user: dict = Depends(get_current_user)):
     """POST endpoint to search Arxiv using a request body."""
     try:
-        agent = ArxivAgent(
-            selected_document=request.selected_document, 
-            user_query=request.user_query
-        )
-        results = agent.search_arxiv(request.user_query, num_results=request.num_results)
+        results = await cached_arxiv_search(request.user_query, request.num_results)
         return {"status": "success", "data": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -7,7 +7,12 @@ from pydantic import BaseModel
 import snowflake.connector
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+from collections import OrderedDict
+from contextlib import contextmanager
 import os
+import queue
+import threading
+import time
 
 # Load environment variables
 load_dotenv()
@@ -35,6 +40,12 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 # Initialize HTTPBearer for secured routes
 security = HTTPBearer()
 
+# Connection pool and principal cache tuning
+SNOWFLAKE_POOL_SIZE = int(os.getenv("SNOWFLAKE_POOL_SIZE", 5))
+SNOWFLAKE_POOL_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_TIMEOUT", 10))  # Seconds to wait for a free connection
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 300))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+
 # Snowflake connection function
 def create_snowflake_connection():
     try:
@@ -60,6 +71,122 @@ def create_snowflake_connection():
         print(f"Error connecting to Snowflake: {e}")
         return None
 
+class SnowflakeConnectionPool:
+    """Bounded pool of reusable Snowflake connections, opened on demand up to max_size."""
+
+    def __init__(self, max_size=SNOWFLAKE_POOL_SIZE, timeout=SNOWFLAKE_POOL_TIMEOUT):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.max_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                connection = create_snowflake_connection()
+                if connection is None:
+                    with self._lock:
+                        self._opened -= 1
+                return connection
+            try:
+                connection = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                return None
+        if connection.is_closed():
+            self._discard(connection)
+            return self._acquire()
+        return connection
+
+    def _discard(self, connection):
+        with self._lock:
+            self._opened -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def connection(self):
+        """Yields a pooled connection; connections that raise database errors are closed instead of reused."""
+        connection = self._acquire()
+        if connection is None:
+            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database connection failed")
+        try:
+            yield connection
+        except HTTPException:
+            # Application-level rejection; the connection itself is fine
+            self._idle.put(connection)
+            raise
+        except Exception:
+            self._discard(connection)
+            raise
+        else:
+            self._idle.put(connection)
+
+    def close_all(self):
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+
+class PrincipalCache:
+    """TTL cache of validated users keyed by JWT subject, bounded with LRU eviction."""
+
+    def __init__(self, ttl=PRINCIPAL_CACHE_TTL, max_size=PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                self._entries.pop(username, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, username, user):
+        with self._lock:
+            self._entries[username] = (user, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+connection_pool = None
+principal_cache = PrincipalCache()
+
+def init_connection_pool():
+    """Creates the process-wide Snowflake pool; called at app startup."""
+    global connection_pool
+    if connection_pool is None:
+        connection_pool = SnowflakeConnectionPool()
+    return connection_pool
+
+def close_connection_pool():
+    """Closes idle pooled connections; called at app shutdown."""
+    if connection_pool is not None:
+        connection_pool.close_all()
+
 # Password hashing function
 def hash_password(password: str) -> str:
     return hmac.new(SECRET_KEY.encode(), msg=password.encode(), digestmod=hashlib.sha256).hexdigest()
@@ -82,33 +209,30 @@ def decode_jwt_token(token: str):
 
 # Fetch user from Snowflake database (using DictCursor)
 def get_user_from_db(username: str):
-    connection = create_snowflake_connection()
-    if connection is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database connection failed")
-    
     try:
-        cursor = connection.cursor(snowflake.connector.DictCursor)  # Use DictCursor to get a dictionary result
-        query = "SELECT * FROM users WHERE username = %s"
-        print(f"Running query: {query} with username: {username}")  # Debugging print
-        cursor.execute(query, (username,))
-        user = cursor.fetchone()  # This will now return a dictionary
-        print(f"User fetched: {user}")  # Debugging print
-        return user
+        with init_connection_pool().connection() as connection:
+            with connection.cursor(snowflake.connector.DictCursor) as cursor:  # DictCursor returns dictionary rows
+                cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+                return cursor.fetchone()
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error fetching user from Snowflake: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Error fetching user from database")
-    finally:
-        cursor.close()
-        connection.close()
 
-# Get current user based on JWT
+# Get current user based on JWT; a cached principal skips the database entirely
 def get_current_user(authorization: HTTPAuthorizationCredentials = Depends(security)):
     token = authorization.credentials
     payload = decode_jwt_token(token)
     username = payload.get("username")
-    user = get_user_from_db(username)
+    user = principal_cache.get(username)
     if user is None:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        user = get_user_from_db(username)
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+        # Never keep the password hash in the cache
+        user = {key: value for key, value in user.items() if key != "HASHED_PASSWORD"}
+        principal_cache.put(username, user)
     return user
 
 # Pydantic models for request bodies
@@ -121,39 +245,42 @@ class UserRegister(BaseModel):
     email: str
     password: str
 
+class PasswordChange(BaseModel):
+    old_password: str
+    new_password: str
+
 # Register a new user
 @router.post("/register")
 def register(user: UserRegister):
-    connection = create_snowflake_connection()
-    if connection is None:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database connection failed")
-    
     try:
-        cursor = connection.cursor()
-        hashed_password = hash_password(user.password)
-        
-        # Check if username already exists
-        query_check = "SELECT * FROM users WHERE username = %s"
-        cursor.execute(query_check, (user.username,))
-        
-        if cursor.fetchone():
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
-
-        # Insert new user
-        query_insert = "INSERT INTO users (username, email, hashed_password) VALUES (%s, %s, %s)"
-        cursor.execute(query_insert, (user.username, user.email, hashed_password))
-        
-        connection.commit()
-        
+        with init_connection_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                hashed_password = hash_password(user.password)
+
+                # Check if username already exists
+                query_check = "SELECT * FROM users WHERE username = %s"
+                cursor.execute(query_check, (user.username,))
+
+                if cursor.fetchone():
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already registered")
+
+                # Insert new user
+                query_insert = "INSERT INTO users (username, email, hashed_password) VALUES (%s, %s, %s)"
+                cursor.execute(query_insert, (user.username, user.email, hashed_password))
+
+                connection.commit()
+        principal_cache.invalidate(user.username)
+
         return {"message": "User registered successfully"}
-    
+
+    except HTTPException as e:
+        if e.status_code == status.HTTP_400_BAD_REQUEST:
+            raise
+        print(f"Error registering user: {e.detail}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to register user")
     except Exception as e:
         print(f"Error registering user: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to register user")
-    
-    finally:
-        cursor.close()
-        connection.close()
 
 # Login an existing user
 @router.post("/login")
@@ -166,6 +293,26 @@ def login(user: UserLogin):
     
     raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
 
+# Change the password of the authenticated user
+@router.post("/change-password")
+def change_password(request: PasswordChange, current_user: Dict = Depends(get_current_user)):
+    username = current_user["USERNAME"]
+    db_user = get_user_from_db(username)
+    if not db_user or db_user["HASHED_PASSWORD"] != hash_password(request.old_password):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    try:
+        with init_connection_pool().connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE users SET hashed_password = %s WHERE username = %s",
+                               (hash_password(request.new_password), username))
+                connection.commit()
+    except Exception as e:
+        print(f"Error changing password: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to change password")
+    finally:
+        principal_cache.invalidate(username)
+    return {"message": "Password changed successfully"}
+
 # Protected route
 @router.get("/protected")
 def protected_route(current_user: Dict = Depends(get_current_user)):
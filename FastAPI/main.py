@@ -1,16 +1,28 @@
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.middleware.cors import CORSMiddleware
-from jwtauth import router as auth_router
+from jwtauth import router as auth_router, init_connection_pool, close_connection_pool, get_current_user
 from arxiv_agent_api import router as arxiv_router
 from web_search_agent_api import router as web_search_router
 from rag_agent_api import router as rag_router
+from async_clients import close_async_clients
+from response_cache import caches as response_caches
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 # Initialize environment variables
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Snowflake connections are opened on demand, up to SNOWFLAKE_POOL_SIZE
+    init_connection_pool()
+    yield
+    # Release the pooled outbound HTTP connections shared by the agents
+    await close_async_clients()
+    close_connection_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Include the JWT auth router
 app.include_router(auth_router, prefix="/auth")
@@ -37,5 +49,10 @@ app.add_middleware(
 )
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Welcome to the FastAPI JWT Authentication Application!"}
+
+@app.get("/cache/stats")
+async def cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters of the arXiv and web search response caches."""
+    return {name: cache.stats() for name, cache in response_caches.items()}
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List
 from jwtauth import get_current_user  # Import authentication dependency
+import json
+import logging
 import sys
 import os
+import time
 
 # Add the current directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from rag_agent import RAGAgent
+from rag_agent import RAGAgent, arun_batch
 
 # Create a router for RAGAgent API
 router = APIRouter(prefix="/rag", tags=["RAG Agent"])
@@ -16,12 +21,17 @@ class RAGRequest(BaseModel):
     document_name: str
     query: str
 
+MAX_BATCH_ITEMS = int(os.getenv("RAG_MAX_BATCH_ITEMS", 5000))
+
+class RAGBatchRequest(BaseModel):
+    items: List[RAGRequest] = Field(..., min_length=1)
+
 @router.get("/process")
-def rag_process_get(document_name: str, query: str, current_user: dict = Depends(get_current_user)):
+async def rag_process_get(document_name: str, query: str, current_user: dict = Depends(get_current_user)):
     """GET endpoint to process a query using the RAG agent."""
     try:
         agent = RAGAgent(document_name=document_name, query=query)
-        response = agent.run()
+        response = await agent.arun()
         return {"status": "success", "data": response}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -29,13 +39,62 @@ def rag_process_get(document_name: str, query: str, current_user: dict = Depends
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/process")
-def rag_process_post(request: RAGRequest, current_user: dict = Depends(get_current_user)):
+async def rag_process_post(request: RAGRequest, current_user: dict = Depends(get_current_user)):
     """POST endpoint to process a query using the RAG agent."""
     try:
         agent = RAGAgent(document_name=request.document_name, query=request.query)
-        response = agent.run()
+        response = await agent.arun()
         return {"status": "success", "data": response}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def rag_event_stream(agent: RAGAgent, started: float):
+    """Relay the agent's events as SSE: retrieval, tokens, then done (with ttfb_ms) or error."""
+    ttfb_ms = None
+    try:
+        async for event, data in agent.astream():
+            if ttfb_ms is None:
+                ttfb_ms = round((time.perf_counter() - started) * 1000, 1)
+            if event == "done":
+                data["timings"]["ttfb_ms"] = ttfb_ms
+                logging.info(f"RAG stream finished: {data['timings']}")
+            yield sse_event(event, data)
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+
+def streaming_response(agent: RAGAgent, started: float) -> StreamingResponse:
+    return StreamingResponse(
+        rag_event_stream(agent, started),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stream")
+async def rag_stream_get(document_name: str, query: str, current_user: dict = Depends(get_current_user)):
+    """GET endpoint streaming retrieval results, then answer tokens, as server-sent events."""
+    return streaming_response(RAGAgent(document_name=document_name, query=query), time.perf_counter())
+
+@router.post("/stream")
+async def rag_stream_post(request: RAGRequest, current_user: dict = Depends(get_current_user)):
+    """POST endpoint streaming retrieval results, then answer tokens, as server-sent events."""
+    return streaming_response(RAGAgent(document_name=request.document_name, query=request.query), time.perf_counter())
+
+async def rag_batch_lines(items):
+    """Serialize batch results as NDJSON, one line per question as it completes."""
+    async for result in arun_batch(items):
+        yield json.dumps(result) + "\n"
+
+@router.post("/batch")
+async def rag_batch(request: RAGBatchRequest, current_user: dict = Depends(get_current_user)):
+    """POST endpoint answering many (document_name, query) pairs, streamed back as NDJSON."""
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_ITEMS} items per batch")
+    items = [(item.document_name, item.query) for item in request.items]
+    return StreamingResponse(rag_batch_lines(items), media_type="application/x-ndjson")
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Add Streamlit folder to the Python path for the shared blocking-call pool
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "Streamlit")))
+from async_clients import run_blocking
+
+# Load environment variables
+load_dotenv()
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))  # Seconds a response is served as fresh
+RESPONSE_CACHE_STALE_TTL = float(os.getenv("RESPONSE_CACHE_STALE_TTL", 86400))  # Extra seconds served stale while refreshing
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR")  # Optional on-disk tier shared across workers and restarts
+RESPONSE_CACHE_DISK_SIZE = int(os.getenv("RESPONSE_CACHE_DISK_SIZE", 20000))
+
+# Every cache by name, for the stats endpoint
+caches = {}
+
+
+def normalize_query(query):
+    """Lowercase a query and collapse whitespace so trivially different spellings share an entry."""
+    return " ".join(query.lower().split())
+
+
+class ResponseCache:
+    """Two-tier (memory LRU + optional disk) cache of provider responses with stale-while-revalidate.
+
+    Entries younger than ttl are served as fresh. Entries up to ttl + stale_ttl old
+    are served immediately while one background task refreshes them. Concurrent
+    misses for the same key share a single provider call.
+    """
+
+    def __init__(self, name, ttl=RESPONSE_CACHE_TTL, stale_ttl=RESPONSE_CACHE_STALE_TTL,
+                 max_entries=RESPONSE_CACHE_SIZE, disk_dir=RESPONSE_CACHE_DIR, max_disk_entries=RESPONSE_CACHE_DISK_SIZE):
+        self.name = name
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        self.max_disk_entries = max_disk_entries
+        self.counters = {"hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+        caches[name] = self
+
+    @staticmethod
+    def make_key(query, num_results):
+        return f"{normalize_query(query)}|{num_results}"
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _lookup(self, key):
+        """Return (value, stored_at) from memory, then disk, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.disk_dir:
+            try:
+                with open(self._disk_path(key)) as fp:
+                    record = json.load(fp)
+                entry = (record["value"], record["stored_at"])
+                self._remember(key, entry)
+                self._count("disk_hits")
+                return entry
+            except (OSError, ValueError, KeyError):
+                pass
+        return None
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def _store(self, key, value):
+        entry = (value, time.time())
+        self._remember(key, entry)
+        if self.disk_dir:
+            try:
+                await run_blocking(self._write_disk, key, entry)
+            except OSError as e:
+                # The memory tier still has the entry; a failed disk write must not fail the request
+                logging.warning(f"Could not write {self.name} cache entry to disk: {e}")
+
+    def _write_disk(self, key, entry):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "w") as fp:
+                json.dump({"key": key, "value": entry[0], "stored_at": entry[1]}, fp)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % 256 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Drop expired files and, beyond max_disk_entries, the oldest ones."""
+        entries = sorted(((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.disk_dir)
+                          if entry.name.endswith(".json")), reverse=True)
+        cutoff = time.time() - self.ttl - self.stale_ttl
+        for position, (mtime, path) in enumerate(entries):
+            if position >= self.max_disk_entries or mtime < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def _start_fetch(self, key, fetch, cacheable):
+        """Return the in-flight provider call for key, starting one if needed; cacheable results are stored."""
+        task = self._in_flight.get(key)
+        if task is None:
+            async def run():
+                try:
+                    value = await fetch()
+                    if cacheable(value):
+                        await self._store(key, value)
+                    return value
+                except Exception:
+                    self._count("errors")
+                    raise
+                finally:
+                    self._in_flight.pop(key, None)
+            task = asyncio.ensure_future(run())
+            self._in_flight[key] = task
+        return task
+
+    async def get_or_fetch(self, key, fetch, cacheable=lambda value: True):
+        """Return the cached value for key, calling the async fetch() on a miss or to refresh a stale entry."""
+        entry = self._lookup(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self._count("hits")
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                if key not in self._in_flight:
+                    self._count("refreshes")
+                    # Refresh failures keep the stale entry; they are counted under "errors"
+                    self._start_fetch(key, fetch, cacheable).add_done_callback(lambda task: task.exception())
+                return value
+        self._count("misses")
+        # Shielded so a cancelled request does not cancel the call other waiters share
+        return await asyncio.shield(self._start_fetch(key, fetch, cacheable))
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "size": len(self._entries), "in_flight": len(self._in_flight)}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from jwtauth import get_current_user  # Import authentication dependency
+from response_cache import ResponseCache
 import sys
 import os
 
@@ -11,6 +12,17 @@ from web_search_agent import WebSearchAgent
 # Create a router for WebSearchAgent API
 router = APIRouter(prefix="/web_search", tags=["Web Search"])
 
+# Search results shared by all users, keyed by normalized query and num_results
+web_search_cache = ResponseCache("web_search")
+
+async def cached_web_search(query: str, num_results: int):
+    """Search the web through the response cache; provider errors are returned but never cached."""
+    async def fetch():
+        agent = WebSearchAgent(selected_document="API request", user_query=query, num_results=num_results)
+        return await agent.asearch()
+    return await web_search_cache.get_or_fetch(ResponseCache.make_key(query, num_results), fetch,
+                                               cacheable=lambda results: isinstance(results, list))
+
 # Pydantic model for the request body
 class WebSearchRequest(BaseModel):
     selected_document: str
@@ -18,11 +30,10 @@ class WebSearchRequest(BaseModel):
     num_results: int = 10
 
 @router.get("/search")
-def web_search_get(query: str, num_results: int = 10, current_user: dict = Depends(get_current_user)):
+async def web_search_get(query: str, num_results: int = 10, current_user: dict = Depends(get_current_user)):
     """GET endpoint to perform a web search."""
     try:
-        agent = WebSearchAgent(selected_document="GET request", user_query=query, num_results=num_results)
-        results = agent.search()
+        results = await cached_web_search(query, num_results)
         if isinstance(results, dict) and "error" in results:
             raise HTTPException(status_code=500, detail=results["error"])
         return {"status": "success", "data": results}
@@ -30,15 +41,10 @@ def web_search_get(query: str, num_results: int = 10, current_user: dict = Depen
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/search")
-def web_search_post(request: WebSearchRequest, current_user: dict = Depends(get_current_user)):
+async def web_search_post(request: WebSearchRequest, current_user: dict = Depends(get_current_user)):
     """POST endpoint to perform a web search using a request body."""
     try:
-        agent = WebSearchAgent(
-            selected_document=request.selected_document, 
-            user_query=request.user_query,
-            num_results=request.num_results
-        )
-        results = agent.search()
+        results = await cached_web_search(request.user_query, request.num_results)
         if isinstance(results, dict) and "error" in results:
             raise HTTPException(status_code=500, detail=results["error"])
         return {"status": "success", "data": results}
@@ -1,7 +1,11 @@
+import re
 import arxiv
 import nltk
 from nltk.corpus import wordnet as wn
 import spacy
+from async_clients import get_http_client, run_blocking
+
+ARXIV_API_URL = "https://export.arxiv.org/api/query"
 
 # Download required NLTK resources
 nltk.download('wordnet')
@@ -47,10 +51,41 @@ class ArxivAgent:
             papers.append(paper_info)
         return papers
 
+    async def asearch_arxiv(self, query: str, num_results: int = 10) -> list:
+        """Search Arxiv for relevant papers without blocking the event loop."""
+        import feedparser
+        expanded_query = await run_blocking(self.expand_query_with_synonyms, query)
+        response = await get_http_client().get(ARXIV_API_URL, params={
+            "search_query": expanded_query,
+            "start": 0,
+            "max_results": num_results,
+            "sortBy": "relevance",
+            "sortOrder": "descending",
+        })
+        response.raise_for_status()
+        feed = feedparser.parse(response.text)
+        papers = []
+        for entry in feed.entries:
+            pdf_url = next((link.href for link in entry.get("links", []) if link.get("title") == "pdf"), None)
+            papers.append({
+                "title": re.sub(r"\s+", " ", entry.title),
+                "summary": entry.summary,
+                "pdf_url": pdf_url
+            })
+        return papers
+
     def run(self) -> dict:
         """Execute the agent to search Arxiv."""
         print(f"Running ArxivAgent for document: {self.selected_document} and query: {self.user_query}")
-        results = self.search_arxiv(self.user_query)
+        return self.format_results(self.search_arxiv(self.user_query))
+
+    async def arun(self) -> dict:
+        """Execute the agent to search Arxiv asynchronously."""
+        return self.format_results(await self.asearch_arxiv(self.user_query))
+
+    @staticmethod
+    def format_results(results: list) -> dict:
+        """Format search results as an agent answer."""
         if not results:
             return {"answer": "No relevant papers found on Arxiv.", "details": ""}
         
@@ -0,0 +1,79 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 30))
+# Threads for calls that have no async client (boto3, Pinecone, model inference)
+BLOCKING_POOL_SIZE = int(os.getenv("BLOCKING_POOL_SIZE", 32))
+
+_http_client = None
+_openai_client = None
+_sync_openai_client = None
+_blocking_executor = None
+
+
+def get_http_client():
+    """
+    Return the process-wide pooled httpx.AsyncClient, creating it on first use.
+    Must be called from a running event loop.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        import httpx
+        _http_client = httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+def get_openai_client():
+    """
+    Return the process-wide AsyncOpenAI client, sharing the pooled HTTP client.
+    """
+    global _openai_client
+    if _openai_client is None:
+        from openai import AsyncOpenAI
+        _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=get_http_client())
+    return _openai_client
+
+
+def get_sync_openai_client():
+    """
+    Return the process-wide blocking OpenAI client, for streaming outside an event loop.
+    """
+    global _sync_openai_client
+    if _sync_openai_client is None:
+        from openai import OpenAI
+        _sync_openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _sync_openai_client
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking call on the bounded worker pool without blocking the event loop.
+    """
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_POOL_SIZE, thread_name_prefix="blocking")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, functools.partial(func, *args, **kwargs))
+
+
+async def close_async_clients():
+    """
+    Close the pooled clients; call on application shutdown.
+    """
+    global _http_client, _openai_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = None
+    _openai_client = None
@@ -0,0 +1,93 @@
+"""
+Benchmark the local vector index encodings: memory footprint, recall@k against
+exact float32 search, and single-query throughput.
+
+Usage (from the Streamlit directory):
+
+    python benchmark_vector_index.py [--vectors 100000] [--queries 200] [--top-k 10]
+
+Vectors are synthetic and clustered, which is closer to sentence embeddings
+than uniform noise. Pass --index-dir to benchmark the float rows of an existing
+"local" index directory instead.
+"""
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from local_vector_index import LocalExactIndex, LocalQuantizedIndex, _normalize
+
+
+def synthetic_vectors(count, dimension, clusters=256, seed=0):
+    """
+    Draw unit vectors around random cluster centres.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignment = rng.integers(0, clusters, count)
+    vectors = centres[assignment] + 0.6 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return _normalize(vectors)
+
+
+def build(index, vectors, batch_size=50000):
+    for start in range(0, len(vectors), batch_size):
+        block = vectors[start:start + batch_size]
+        index.upsert([(f"v{start + row}", values) for row, values in enumerate(block)])
+    # Flushed rows are served from disk, as they would be after ingestion
+    index.flush()
+    return index
+
+
+def run_queries(index, queries, top_k, **query_options):
+    started = time.perf_counter()
+    results = [[match["id"] for match in index.query(query, top_k=top_k, include_metadata=False,
+                                                     **query_options)["matches"]]
+               for query in queries]
+    return results, len(queries) / (time.perf_counter() - started)
+
+
+def recall_at_k(results, truth):
+    hits = sum(len(set(found) & set(expected)) for found, expected in zip(results, truth))
+    return hits / sum(len(expected) for expected in truth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local vector index encodings.")
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--pq-subvectors", type=int, default=48)
+    parser.add_argument("--index-dir", help="Existing 'local' index directory to take vectors from.")
+    args = parser.parse_args()
+
+    if args.index_dir:
+        vectors = np.load(os.path.join(args.index_dir, "vectors.npy"))
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dimension)
+    dimension = vectors.shape[1]
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), args.queries, replace=False)]
+    queries = _normalize(queries + 0.1 * rng.standard_normal(queries.shape).astype(np.float32))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        exact = build(LocalExactIndex(os.path.join(workdir, "float32"), dimension), vectors)
+        truth, exact_qps = run_queries(exact, queries, args.top_k)
+        rows = [("float32 exact", exact._matrix.nbytes, 1.0, exact_qps)]
+
+        for encoding, options in (("int8", {}), ("pq", {"subvectors": args.pq_subvectors})):
+            index = build(LocalQuantizedIndex(os.path.join(workdir, encoding), dimension,
+                                              encoding=encoding, **options), vectors)
+            for rescore in (False, True):
+                results, qps = run_queries(index, queries, args.top_k, rescore=rescore)
+                label = f"{encoding}{' + rescore' if rescore else ''}"
+                rows.append((label, index.memory_bytes(), recall_at_k(results, truth), qps))
+
+    print(f"{len(vectors)} vectors x {dimension} dims, {len(queries)} queries, top_k={args.top_k}")
+    print(f"{'encoding':<18}{'memory (MB)':>12}{'recall@k':>10}{'QPS':>10}")
+    for label, memory, recall, qps in rows:
+        print(f"{label:<18}{memory / 1e6:>12.1f}{recall:>10.3f}{qps:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
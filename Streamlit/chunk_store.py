@@ -0,0 +1,239 @@
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_cache_key(metadata):
+    """
+    Identify a chunk's text by content: the chunk_hash recorded at ingestion, or
+    for legacy one-object-per-chunk vectors the S3 key, which is named by that hash.
+    """
+    return metadata.get("chunk_hash") or metadata["s3_key"]
+
+
+class ChunkTextCache:
+    """
+    Bounded two-tier cache of chunk texts: an in-memory LRU backed by an
+    optional directory of small files that survives restarts.
+
+    Keys are content hashes (see chunk_cache_key), so an entry can never go
+    stale; re-ingesting a document only adds entries for text that changed.
+    """
+
+    def __init__(self, max_entries=2048, disk_dir=None, max_disk_entries=20000):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".txt")
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return text
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, encoding="utf-8") as fp:
+                    text = fp.read()
+                # Pruning drops the oldest mtimes first, so a read counts as a use
+                os.utime(path)
+                self._remember(key, text)
+                with self._lock:
+                    self.disk_hits += 1
+                return text
+            except OSError:
+                pass
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if self.disk_dir:
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.part"
+            with open(tmp_path, "w", encoding="utf-8") as fp:
+                fp.write(text)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_writes += 1
+                prune = self._disk_writes % 256 == 0
+            if prune:
+                self._prune_disk()
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._entries[key] = text
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _prune_disk(self):
+        """
+        Beyond max_disk_entries, drop the least recently used files.
+        """
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith(".txt"):
+                entries.append((entry.stat().st_mtime, entry.path))
+        entries.sort(reverse=True)
+        for _, path in entries[self.max_disk_entries:]:
+            _remove_quietly(path)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses}
+
+
+# S3 user-metadata key holding a shard's version (see Airflow/scripts/chunk_shards.py)
+SHARD_VERSION_METADATA = "shard-version"
+
+
+class StaleChunkError(ValueError):
+    """
+    Raised when a vector points into a different version of its shard than the one in S3,
+    i.e. the document was re-ingested after the vector was read.
+    """
+
+
+class ChunkStore:
+    """
+    Reads chunk texts from S3, either from packed per-document shards or from
+    legacy one-object-per-chunk keys.
+
+    Packed chunks are fetched with a single ranged GET using the offset and length
+    stored in the vector metadata. When cache_dir is set, a shard is downloaded
+    whole on first use and later reads are served locally. Local copies are
+    keyed on the shard_version recorded in the metadata, so a re-ingested
+    shard is never read at another version's offsets; shards written before
+    versioning are re-validated by ETag every etag_ttl seconds instead.
+    Fetched texts are kept in text_cache when one is given.
+    """
+
+    def __init__(self, s3_client, bucket, cache_dir=None, text_cache=None, etag_ttl=300):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.text_cache = text_cache
+        self.etag_ttl = etag_ttl
+        self._local_shards = {}
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def fetch(self, metadata):
+        """
+        Return the chunk text referenced by a vector's metadata.
+        """
+        s3_key = metadata.get("s3_key")
+        if not s3_key:
+            raise ValueError("No S3 key found in the chunk metadata.")
+        if self.text_cache is None:
+            return self._fetch(metadata)
+        key = chunk_cache_key(metadata)
+        text = self.text_cache.get(key)
+        if text is None:
+            text = self._fetch(metadata)
+            self.text_cache.put(key, text)
+        return text
+
+    def _fetch(self, metadata):
+        s3_key = metadata["s3_key"]
+        if "offset" not in metadata:
+            # Legacy layout: one S3 object per chunk
+            response = self.s3.get_object(Bucket=self.bucket, Key=s3_key)
+            return response["Body"].read().decode("utf-8")
+
+        offset, length = int(metadata["offset"]), int(metadata["length"])
+        version = metadata.get("shard_version")
+        local_path = self._local_shard(s3_key, version) if self.cache_dir else None
+        if local_path:
+            with open(local_path, "rb") as shard:
+                shard.seek(offset)
+                line = shard.read(length)
+        else:
+            response = self.s3.get_object(Bucket=self.bucket, Key=s3_key,
+                                          Range=f"bytes={offset}-{offset + length - 1}")
+            self._check_version(s3_key, version, response)
+            line = response["Body"].read()
+        return json.loads(line.decode("utf-8"))["text"]
+
+    @staticmethod
+    def _check_version(s3_key, version, response):
+        if version is not None:
+            found = (response.get("Metadata") or {}).get(SHARD_VERSION_METADATA)
+            if found != version:
+                raise StaleChunkError(f"Shard {s3_key} is at version {found}, not {version}; "
+                                      f"the document was re-ingested.")
+
+    def _local_shard(self, s3_key, version=None):
+        """
+        Return the path of an up-to-date local copy of a shard, downloading it if needed.
+        """
+        # Every version of a document's shard shares one name, so a newer download replaces older copies
+        name = hashlib.sha1(posixpath.dirname(s3_key).encode("utf-8")).hexdigest()
+        with self._lock:
+            if version is not None:
+                local_path = os.path.join(self.cache_dir, f"{name}-v{version}.jsonl")
+                if not os.path.exists(local_path):
+                    self._download(s3_key, local_path, version)
+                return local_path
+
+            cached = self._local_shards.get(s3_key)
+            if cached is not None and time.monotonic() - cached[1] < self.etag_ttl:
+                return cached[0]
+            etag = self.s3.head_object(Bucket=self.bucket, Key=s3_key)["ETag"].strip('"')
+            local_path = os.path.join(self.cache_dir, f"{name}-{etag}.jsonl")
+            if not os.path.exists(local_path):
+                self._download(s3_key, local_path)
+            self._local_shards[s3_key] = (local_path, time.monotonic())
+            return local_path
+
+    def _download(self, s3_key, local_path, version=None):
+        """
+        Stream a shard into local_path; the body and the version it is checked
+        against come from the same GET, so a concurrent re-ingestion cannot mix them.
+        """
+        logger.info(f"Caching shard {s3_key} locally at {local_path}")
+        response = self.s3.get_object(Bucket=self.bucket, Key=s3_key)
+        self._check_version(s3_key, version, response)
+        tmp_path = f"{local_path}.{threading.get_ident()}.part"
+        try:
+            with open(tmp_path, "wb") as fp:
+                for block in iter(lambda: response["Body"].read(1 << 20), b""):
+                    fp.write(block)
+            os.replace(tmp_path, local_path)
+        finally:
+            _remove_quietly(tmp_path)
+        # Older copies of the same shard can no longer be read correctly
+        prefix = os.path.basename(local_path).split("-")[0] + "-"
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith(".jsonl") and entry.path != local_path:
+                _remove_quietly(entry.path)
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,955 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def _normalize(matrix):
+    """
+    Scale rows to unit length so inner product equals cosine similarity.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+_FILTER_OPERATORS = {
+    "$eq": lambda value, operand: value == operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$nin": lambda value, operand: value not in operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+}
+
+
+def matches_filter(metadata, metadata_filter):
+    """
+    Evaluate a Pinecone-style metadata filter ($eq, $ne, $in, $nin, $gt(e), $lt(e), $and, $or).
+    """
+    if not metadata_filter:
+        return True
+    for field, condition in metadata_filter.items():
+        if field == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif field == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(field)
+            if not all(_FILTER_OPERATORS[operator](value, operand) for operator, operand in condition.items()):
+                return False
+        elif metadata.get(field) != condition:
+            return False
+    return True
+
+
+# Metadata fields with an attribute index; filters on other fields fall back to a scan
+INDEXED_FIELDS = ("pdf_name", "section", "element_type", "page_start", "page_end", "ingested_at")
+_SCALAR_TYPES = (str, int, float, bool)
+
+
+class AttributeIndex:
+    """
+    Inverted index from (field, value) to row positions, for filtered search.
+
+    Filters are evaluated as packed bitmaps (one bit per row) combined with
+    bitwise AND / OR / NOT, so cost depends on the number of rows / 8 and the
+    values touched, not on the size of each row's metadata. Bitmaps are built
+    from the postings on first use and kept in a small LRU.
+    """
+
+    def __init__(self, fields=INDEXED_FIELDS, max_cached_bitmaps=256):
+        self.fields = set(fields)
+        self.max_cached_bitmaps = max_cached_bitmaps
+        self.size = 0
+        self._postings = {field: {} for field in self.fields}
+        self._unindexable = set()
+        self._bitmaps = OrderedDict()
+
+    def truncate(self, size):
+        """
+        Shrink the row range to size; rows at or beyond it must already have been removed.
+        """
+        self.size = size
+        self._bitmaps.clear()
+
+    def rebuild(self, metadata_rows):
+        self.size = 0
+        self._postings = {field: {} for field in self.fields}
+        self._unindexable = set()
+        self._bitmaps.clear()
+        for position, metadata in enumerate(metadata_rows):
+            self.update(position, None, metadata)
+
+    def update(self, position, old_metadata, new_metadata):
+        """
+        Move a row from its old metadata values to its new ones (either may be None).
+        """
+        if position >= self.size:
+            self.size = position + 1
+            self._bitmaps.clear()
+        for metadata, add in ((old_metadata, False), (new_metadata, True)):
+            for field in self.fields.intersection(metadata or ()):
+                value = metadata[field]
+                if not isinstance(value, _SCALAR_TYPES):
+                    self._unindexable.add(field)
+                    continue
+                postings = self._postings[field]
+                if add:
+                    postings.setdefault(value, set()).add(position)
+                elif value in postings:
+                    postings[value].discard(position)
+                    if not postings[value]:
+                        del postings[value]
+                self._bitmaps.pop((field, value), None)
+
+    def _bitmap(self, field, value):
+        key = (field, value)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            rows = np.zeros(self.size, dtype=bool)
+            positions = self._postings[field].get(value)
+            if positions:
+                rows[np.fromiter(positions, dtype=np.int64, count=len(positions))] = True
+            bitmap = np.packbits(rows)
+            self._bitmaps[key] = bitmap
+            while len(self._bitmaps) > self.max_cached_bitmaps:
+                self._bitmaps.popitem(last=False)
+        else:
+            self._bitmaps.move_to_end(key)
+        return bitmap
+
+    def _union(self, field, values):
+        result = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in self._postings[field]:
+                result |= self._bitmap(field, value)
+        return result
+
+    def _evaluate(self, metadata_filter):
+        result = None
+        for field, condition in metadata_filter.items():
+            if field in ("$and", "$or"):
+                parts = [self._evaluate(clause) for clause in condition]
+                bits = parts[0]
+                for part in parts[1:]:
+                    bits = bits & part if field == "$and" else bits | part
+            else:
+                bits = None
+                operators = condition if isinstance(condition, dict) else {"$eq": condition}
+                for operator, operand in operators.items():
+                    if operator == "$eq":
+                        part = self._union(field, [operand])
+                    elif operator == "$ne":
+                        part = ~self._union(field, [operand])
+                    elif operator == "$in":
+                        part = self._union(field, operand)
+                    elif operator == "$nin":
+                        part = ~self._union(field, operand)
+                    else:
+                        compare = _FILTER_OPERATORS[operator]
+                        part = self._union(field, [value for value in self._postings[field]
+                                                   if not isinstance(value, str) and compare(value, operand)])
+                    bits = part if bits is None else bits & part
+            result = bits if result is None else result & bits
+        return result
+
+    def evaluate(self, metadata_filter):
+        """
+        Return the sorted row positions matching a Pinecone-style filter, or None
+        when the filter touches a field this index cannot answer.
+        """
+        if not self.supports(metadata_filter):
+            return None
+        bits = self._evaluate(metadata_filter)
+        return np.flatnonzero(np.unpackbits(bits, count=self.size))
+
+    def supports(self, metadata_filter):
+        for field, condition in metadata_filter.items():
+            if field in ("$and", "$or"):
+                if not all(self.supports(clause) for clause in condition):
+                    return False
+            elif field not in self.fields or field in self._unindexable:
+                return False
+            elif isinstance(condition, dict) and not set(condition) <= set(_FILTER_OPERATORS):
+                return False
+        return bool(metadata_filter)
+
+
+def _grown(array, rows):
+    """
+    Return array, or a copy with room for at least rows rows. Capacity doubles,
+    so appending n rows one batch at a time costs O(n) copies overall.
+    """
+    if rows <= len(array):
+        return array
+    grown = np.zeros((max(rows, 2 * len(array), 64),) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _id_pages(ids, prefix=None, limit=100):
+    """
+    Yield sorted ids starting with prefix in pages of at most limit, like Pinecone's Index.list.
+    """
+    ids = sorted(vector_id for vector_id in ids if vector_id.startswith(prefix or ""))
+    for start in range(0, len(ids), limit):
+        yield ids[start:start + limit]
+
+
+class _PersistedIndex:
+    """
+    Write-behind persistence shared by the local indexes: writes stay in memory
+    until flush(), and changed_on_disk() tells a reader that another process
+    (e.g. ingestion) has flushed a newer copy.
+    """
+
+    _dirty = False
+    _disk_stamp = None
+
+    def _records_stamp(self):
+        try:
+            stat = os.stat(os.path.join(self.path, "records.json"))
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def flush(self):
+        """
+        Write pending changes to disk, if there are any.
+        """
+        with self._lock:
+            if self._dirty:
+                self.persist()
+                self._dirty = False
+            self._disk_stamp = self._records_stamp()
+
+    def changed_on_disk(self):
+        """
+        True when the files on disk are newer than this copy, which holds no unflushed writes.
+        """
+        return not self._dirty and self._records_stamp() != self._disk_stamp
+
+
+def _as_records(vectors):
+    """
+    Accept Pinecone-style upsert payloads: dicts or (id, values[, metadata]) tuples.
+    """
+    for vector in vectors:
+        if isinstance(vector, dict):
+            yield vector["id"], vector["values"], vector.get("metadata") or {}
+        else:
+            vector_id, values, *rest = vector
+            yield vector_id, values, (rest[0] if rest else {}) or {}
+
+
+class LocalExactIndex(_PersistedIndex):
+    """
+    In-process vector index doing exact cosine search over a NumPy matrix.
+
+    Mirrors the subset of the Pinecone Index API that this project uses
+    (upsert, query, delete, list, describe_index_stats) and persists to a
+    directory on flush(). Rows live in a buffer with spare capacity, and a
+    delete moves the last row into the freed slot, so writes cost time in
+    the rows they touch rather than in the size of the index.
+    """
+
+    def __init__(self, path, dimension):
+        self.path = path
+        self.dimension = dimension
+        self._lock = threading.RLock()
+        self._ids = []
+        self._positions = {}
+        self._metadata = []
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._attributes = AttributeIndex()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        self._attributes.rebuild(self._metadata)
+        self._disk_stamp = self._records_stamp()
+
+    @property
+    def _matrix(self):
+        """
+        The live rows (a view; the buffer behind it may hold spare capacity).
+        """
+        return self._vectors[:len(self._ids)]
+
+    # Persistence
+    def _load(self, mmap_mode=None):
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        records_path = os.path.join(self.path, "records.json")
+        if os.path.exists(vectors_path) and os.path.exists(records_path):
+            self._vectors = np.load(vectors_path, mmap_mode=mmap_mode)
+            with open(records_path) as fp:
+                records = json.load(fp)
+            self._ids = records["ids"]
+            self._metadata = records["metadata"]
+            self._positions = {vector_id: position for position, vector_id in enumerate(self._ids)}
+
+    def persist(self):
+        """
+        Write the index to disk atomically. Prefer flush(), which skips clean indexes.
+        """
+        with self._lock:
+            tmp_vectors = os.path.join(self.path, "vectors.tmp.npy")
+            tmp_records = os.path.join(self.path, "records.tmp.json")
+            self._save_vectors(tmp_vectors)
+            with open(tmp_records, "w") as fp:
+                json.dump({"ids": self._ids, "metadata": self._metadata}, fp)
+            os.replace(tmp_vectors, os.path.join(self.path, "vectors.npy"))
+            os.replace(tmp_records, os.path.join(self.path, "records.json"))
+
+    # Hooks for subclasses that store rows differently or keep derived structures in step with them
+    def _save_vectors(self, path):
+        np.save(path, self._matrix)
+
+    def _write_rows(self, positions, rows):
+        self._vectors = _grown(self._vectors, len(self._ids))
+        self._vectors[positions] = rows
+
+    def _rows_written(self, positions):
+        pass
+
+    def _move_row(self, source, target):
+        self._vectors[target] = self._vectors[source]
+
+    def _rows_truncated(self, count):
+        pass
+
+    # Pinecone-compatible API
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            written = {}
+            for vector_id, values, metadata in _as_records(vectors):
+                if vector_id in self._positions:
+                    position = self._positions[vector_id]
+                    self._attributes.update(position, self._metadata[position], metadata)
+                    self._metadata[position] = metadata
+                else:
+                    position = len(self._ids)
+                    self._positions[vector_id] = position
+                    self._ids.append(vector_id)
+                    self._metadata.append(metadata)
+                    self._attributes.update(position, None, metadata)
+                written[position] = values
+            if written:
+                positions = np.fromiter(written, dtype=np.int64, count=len(written))
+                self._write_rows(positions, _normalize(np.asarray(list(written.values()), dtype=np.float32)
+                                                       .reshape(len(written), -1)))
+                self._rows_written(positions)
+                self._dirty = True
+            return {"upserted_count": len(written)}
+
+    def _candidates(self, filter):
+        """
+        Return the row positions passing a metadata filter, from the attribute
+        index when it covers the filter and by scanning metadata otherwise.
+        """
+        if filter:
+            positions = self._attributes.evaluate(filter)
+            if positions is not None:
+                return positions
+            return np.array([position for position, metadata in enumerate(self._metadata)
+                             if matches_filter(metadata, filter)], dtype=np.int64)
+        return np.arange(len(self._ids))
+
+    def query(self, vector, top_k=3, include_metadata=True, filter=None, **kwargs):
+        with self._lock:
+            candidates = self._candidates(filter)
+            if not len(candidates):
+                return {"matches": []}
+            query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+            rows = self._matrix if len(candidates) == len(self._ids) else self._matrix[candidates]
+            scores = rows @ query
+            top_k = min(top_k, len(scores))
+            top = np.argpartition(-scores, top_k - 1)[:top_k]
+            top = top[np.argsort(-scores[top])]
+            return {"matches": [self._match(candidates[rank], scores[rank], include_metadata) for rank in top]}
+
+    def query_batch(self, vectors, top_k=3, include_metadata=True, filter=None, **kwargs):
+        """
+        Search many query vectors at once with a single matrix multiplication.
+        Returns one {"matches": [...]} response per query, in order.
+        """
+        with self._lock:
+            candidates = self._candidates(filter)
+            if not len(candidates) or not len(vectors):
+                return [{"matches": []} for _ in vectors]
+            queries = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1))
+            rows = self._matrix if len(candidates) == len(self._ids) else self._matrix[candidates]
+            scores = rows @ queries.T
+            top_k = min(top_k, len(candidates))
+            top = np.argpartition(-scores, top_k - 1, axis=0)[:top_k]
+            responses = []
+            for column in range(len(queries)):
+                ranked = top[:, column][np.argsort(-scores[top[:, column], column])]
+                responses.append({"matches": [self._match(candidates[rank], scores[rank, column], include_metadata)
+                                              for rank in ranked]})
+            return responses
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._lock:
+            if delete_all:
+                self._ids, self._metadata, self._positions = [], [], {}
+                self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+                self._attributes.rebuild([])
+            else:
+                for vector_id in ids or []:
+                    position = self._positions.pop(vector_id, None)
+                    if position is None:
+                        continue
+                    last = len(self._ids) - 1
+                    self._attributes.update(position, self._metadata[position], None)
+                    if position != last:
+                        # Fill the hole with the last row so the live rows stay contiguous
+                        self._attributes.update(last, self._metadata[last], None)
+                        self._attributes.update(position, None, self._metadata[last])
+                        self._move_row(last, position)
+                        self._ids[position] = self._ids[last]
+                        self._metadata[position] = self._metadata[last]
+                        self._positions[self._ids[position]] = position
+                    self._ids.pop()
+                    self._metadata.pop()
+                self._attributes.truncate(len(self._ids))
+            self._rows_truncated(len(self._ids))
+            self._dirty = True
+            return {}
+
+    def list(self, prefix=None, limit=100, **kwargs):
+        """
+        Yield pages of ids starting with prefix, as Pinecone's Index.list does.
+        """
+        with self._lock:
+            ids = list(self._ids)
+        return _id_pages(ids, prefix, limit)
+
+    def describe_index_stats(self):
+        return {"dimension": self.dimension, "total_vector_count": len(self._ids)}
+
+    def _match(self, position, score, include_metadata):
+        match = {"id": self._ids[position], "score": float(score)}
+        if include_metadata:
+            match["metadata"] = self._metadata[position]
+        return match
+
+
+# Rows scored per block so the float32 copy of a code block stays small
+_SCORE_BLOCK_ROWS = 1024
+
+
+class Int8Codec:
+    """
+    Scalar quantizer: each dimension is scaled by its largest absolute value and
+    rounded to int8, a 4x reduction over float32.
+
+    The scale is fit on a sample and widened (with headroom) whenever later rows
+    exceed it, so values are never clipped; existing codes of a widened
+    dimension are requantized from the codes themselves, without the float rows.
+    """
+
+    min_train_size = 1024
+
+    def __init__(self, dimension, train_size=32768, headroom=1.25):
+        self.dimension = dimension
+        self.train_size = train_size
+        self.headroom = headroom
+        self.scale = None
+
+    @property
+    def trained(self):
+        return self.scale is not None
+
+    def fit(self, matrix):
+        self.scale = np.maximum(np.abs(matrix).max(axis=0), 1e-12).astype(np.float32) / 127.0
+        return self
+
+    def widen(self, matrix, codes):
+        """
+        Grow the scale of every dimension the rows exceed, requantizing codes in place.
+        """
+        if not len(matrix):
+            return
+        needed = np.abs(matrix).max(axis=0) / 127.0
+        over = np.flatnonzero(needed > self.scale)
+        if not len(over):
+            return
+        widened = (needed[over] * self.headroom).astype(np.float32)
+        for start in range(0, len(codes), _SCORE_BLOCK_ROWS):
+            block = codes[start:start + _SCORE_BLOCK_ROWS, over].astype(np.float32)
+            codes[start:start + _SCORE_BLOCK_ROWS, over] = np.rint(block * (self.scale[over] / widened))
+        self.scale[over] = widened
+
+    def encode(self, matrix):
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def empty_codes(self):
+        return np.zeros((0, self.dimension), dtype=np.int8)
+
+    def score(self, codes, query):
+        """
+        Approximate inner products of the encoded rows with a float query.
+        """
+        weighted = (query * self.scale).astype(np.float32)
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _SCORE_BLOCK_ROWS):
+            block = codes[start:start + _SCORE_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ weighted
+        return scores
+
+    def state(self):
+        return {"scale": self.scale}
+
+    def load_state(self, state):
+        self.scale = state["scale"]
+
+
+class PQCodec:
+    """
+    Product quantizer: vectors are split into subvectors, each replaced by the
+    id of its nearest of 256 k-means centroids, so a 384-d vector with 48
+    subvectors takes 48 bytes. Scores use per-query lookup tables (ADC).
+    """
+
+    min_train_size = 1024
+
+    def __init__(self, dimension, subvectors=48, iterations=20, train_size=32768, seed=0):
+        if dimension % subvectors:
+            raise ValueError(f"PQ subvectors ({subvectors}) must divide the dimension ({dimension})")
+        self.dimension = dimension
+        self.subvectors = subvectors
+        self.sub_dimension = dimension // subvectors
+        self.iterations = iterations
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = None
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _split(self, matrix):
+        return matrix.reshape(len(matrix), self.subvectors, self.sub_dimension)
+
+    def fit(self, matrix):
+        rng = np.random.default_rng(self.seed)
+        sample = self._split(np.asarray(matrix, dtype=np.float32))
+        clusters = min(256, len(sample))
+        centroids = np.empty((self.subvectors, clusters, self.sub_dimension), dtype=np.float32)
+        for sub in range(self.subvectors):
+            points = sample[:, sub, :]
+            centers = points[rng.choice(len(points), clusters, replace=False)].copy()
+            for _ in range(self.iterations):
+                assignment = self._nearest(points, centers)
+                counts = np.bincount(assignment, minlength=clusters)
+                sums = np.zeros_like(centers)
+                np.add.at(sums, assignment, points)
+                filled = counts > 0
+                centers[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty clusters from random points
+                if not filled.all():
+                    centers[~filled] = points[rng.choice(len(points), int((~filled).sum()))]
+            centroids[sub] = centers
+        self.centroids = centroids
+        return self
+
+    @staticmethod
+    def _nearest(points, centers):
+        distances = (centers ** 2).sum(axis=1)[None, :] - 2.0 * points @ centers.T
+        return distances.argmin(axis=1)
+
+    def encode(self, matrix):
+        codes = np.empty((len(matrix), self.subvectors), dtype=np.uint8)
+        for start in range(0, len(matrix), _SCORE_BLOCK_ROWS):
+            block = self._split(np.asarray(matrix[start:start + _SCORE_BLOCK_ROWS], dtype=np.float32))
+            for sub in range(self.subvectors):
+                codes[start:start + len(block), sub] = self._nearest(block[:, sub, :], self.centroids[sub])
+        return codes
+
+    def empty_codes(self):
+        return np.zeros((0, self.subvectors), dtype=np.uint8)
+
+    def widen(self, matrix, codes):
+        """
+        Centroids cover any row (at some error), so existing codes stay valid.
+        """
+
+    def score(self, codes, query):
+        """
+        Approximate inner products via a (subvectors x 256) table of query-centroid products.
+        """
+        table = np.einsum("skd,sd->sk", self.centroids, self._split(query.reshape(1, -1))[0])
+        scores = np.zeros(len(codes), dtype=np.float32)
+        for sub in range(self.subvectors):
+            scores += table[sub].astype(np.float32)[codes[:, sub]]
+        return scores
+
+    def state(self):
+        return {"centroids": self.centroids}
+
+    def load_state(self, state):
+        self.centroids = state["centroids"]
+
+
+class LocalQuantizedIndex(LocalExactIndex):
+    """
+    LocalExactIndex variant that searches compressed codes (encoding "int8" or "pq").
+
+    Codes live in memory. Flushed float32 rows are memory-mapped from disk
+    (copy-on-write), rows added since the last flush sit in a small in-memory
+    tail, and flush() streams both to disk block by block, so resident memory
+    is dominated by the codes. Only the shortlist is read back for exact
+    re-scoring (rescore=True). Until codec.min_train_size vectors exist to
+    train the codec on, queries fall back to exact search.
+    """
+
+    def __init__(self, path, dimension, encoding="int8", rescore=True, shortlist_factor=10, **codec_options):
+        if encoding == "int8":
+            self.codec = Int8Codec(dimension, **codec_options)
+        elif encoding == "pq":
+            self.codec = PQCodec(dimension, **codec_options)
+        else:
+            raise ValueError(f"Unknown vector encoding: {encoding}")
+        self.encoding = encoding
+        self.rescore = rescore
+        self.shortlist_factor = shortlist_factor
+        self._code_buffer = self.codec.empty_codes()
+        self._tail = np.zeros((0, dimension), dtype=np.float32)
+        self._base_rows = 0
+        super().__init__(path, dimension)
+
+    @property
+    def _codes(self):
+        return self._code_buffer[:len(self._ids)]
+
+    @property
+    def _matrix(self):
+        """
+        A float copy of every live row; only used while the codec is untrained (few rows).
+        """
+        return self._rows(np.arange(len(self._ids)))
+
+    # Row storage: positions below _base_rows are in the memory map, the rest in the tail
+    def _rows(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        rows = np.empty((len(positions), self.dimension), dtype=np.float32)
+        mapped = positions < self._base_rows
+        rows[mapped] = self._vectors[positions[mapped]]
+        rows[~mapped] = self._tail[positions[~mapped] - self._base_rows]
+        return rows
+
+    def _row_blocks(self):
+        for start in range(0, len(self._ids), _SCORE_BLOCK_ROWS):
+            yield self._rows(np.arange(start, min(start + _SCORE_BLOCK_ROWS, len(self._ids))))
+
+    def _write_rows(self, positions, rows):
+        positions = np.asarray(positions, dtype=np.int64)
+        mapped = positions < self._base_rows
+        if mapped.any():
+            # Copy-on-write: only the touched pages become private memory
+            self._vectors[positions[mapped]] = rows[mapped]
+        if not mapped.all():
+            self._tail = _grown(self._tail, len(self._ids) - self._base_rows)
+            self._tail[positions[~mapped] - self._base_rows] = rows[~mapped]
+
+    def _move_row(self, source, target):
+        self._write_rows([target], self._rows([source]))
+        if self.codec.trained:
+            self._code_buffer[target] = self._code_buffer[source]
+
+    def _rows_truncated(self, count):
+        self._base_rows = min(self._base_rows, count)
+        if not count:
+            self._tail = np.zeros((0, self.dimension), dtype=np.float32)
+            self._code_buffer = self.codec.empty_codes()
+
+    def _save_vectors(self, path):
+        vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32,
+                                            shape=(len(self._ids), self.dimension))
+        start = 0
+        for block in self._row_blocks():
+            vectors[start:start + len(block)] = block
+            start += len(block)
+        vectors.flush()
+        del vectors
+
+    def _load(self, mmap_mode=None):
+        # Copy-on-write mapping: rows are paged in on demand and in-place updates stay private
+        super()._load(mmap_mode="c")
+        self._base_rows = len(self._ids)
+        self._tail = np.zeros((0, self.dimension), dtype=np.float32)
+        codes_path = os.path.join(self.path, f"codes-{self.encoding}.npy")
+        codec_path = os.path.join(self.path, f"codec-{self.encoding}.npz")
+        if os.path.exists(codes_path) and os.path.exists(codec_path):
+            codes = np.load(codes_path)
+            if len(codes) == len(self._ids):
+                with np.load(codec_path) as state:
+                    self.codec.load_state(dict(state))
+                self._code_buffer = codes
+                return
+        self._train()
+
+    def _train(self):
+        """
+        Train the codec on a sample of the rows once there are enough, then encode all of them.
+        """
+        if len(self._ids) < self.codec.min_train_size:
+            return
+        rng = np.random.default_rng(0)
+        sample = np.arange(len(self._ids))
+        if len(sample) > self.codec.train_size:
+            sample = np.sort(rng.choice(len(sample), self.codec.train_size, replace=False))
+        self.codec.fit(self._rows(sample))
+        for block in self._row_blocks():
+            self.codec.widen(block, self.codec.empty_codes())
+        codes = _grown(self.codec.empty_codes(), len(self._ids))
+        start = 0
+        for block in self._row_blocks():
+            codes[start:start + len(block)] = self.codec.encode(block)
+            start += len(block)
+        self._code_buffer = codes
+
+    def _rows_written(self, positions):
+        if not self.codec.trained:
+            self._train()
+            return
+        rows = self._rows(positions)
+        self.codec.widen(rows, self._codes)
+        self._code_buffer = _grown(self._code_buffer, len(self._ids))
+        self._code_buffer[positions] = self.codec.encode(rows)
+
+    def persist(self):
+        with self._lock:
+            super().persist()
+            if self.codec.trained:
+                tmp_codes = os.path.join(self.path, f"codes-{self.encoding}.tmp.npy")
+                tmp_codec = os.path.join(self.path, f"codec-{self.encoding}.tmp.npz")
+                np.save(tmp_codes, self._codes)
+                np.savez(tmp_codec, **self.codec.state())
+                os.replace(tmp_codes, os.path.join(self.path, f"codes-{self.encoding}.npy"))
+                os.replace(tmp_codec, os.path.join(self.path, f"codec-{self.encoding}.npz"))
+            # Serve every row from the file just written; the tail and private pages are released
+            self._vectors = np.load(os.path.join(self.path, "vectors.npy"), mmap_mode="c")
+            self._base_rows = len(self._ids)
+            self._tail = np.zeros((0, self.dimension), dtype=np.float32)
+
+    def query(self, vector, top_k=3, include_metadata=True, filter=None, rescore=None, **kwargs):
+        if not self.codec.trained:
+            return super().query(vector, top_k=top_k, include_metadata=include_metadata, filter=filter)
+        rescore = self.rescore if rescore is None else rescore
+        with self._lock:
+            candidates = self._candidates(filter)
+            if not len(candidates):
+                return {"matches": []}
+            query = _normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+            codes = self._codes if len(candidates) == len(self._ids) else self._codes[candidates]
+            scores = self.codec.score(codes, query)
+            shortlist = min(top_k * self.shortlist_factor if rescore else top_k, len(scores))
+            top = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            if rescore:
+                # Exact scores for the shortlist only; rows are read from the memory map in order
+                order = np.argsort(candidates[top])
+                top = top[order]
+                scores = np.zeros_like(scores)
+                scores[top] = self._rows(candidates[top]) @ query
+            top_k = min(top_k, shortlist)
+            top = top[np.argsort(-scores[top])][:top_k]
+            return {"matches": [self._match(candidates[rank], scores[rank], include_metadata) for rank in top]}
+
+    def query_batch(self, vectors, top_k=3, include_metadata=True, filter=None, **kwargs):
+        """
+        Search many query vectors; codes are scored per query, as a float matmul would defeat the compression.
+        """
+        if not self.codec.trained:
+            return super().query_batch(vectors, top_k=top_k, include_metadata=include_metadata, filter=filter)
+        return [self.query(vector, top_k=top_k, include_metadata=include_metadata, filter=filter, **kwargs)
+                for vector in vectors]
+
+    def memory_bytes(self):
+        """
+        Resident size of the searchable codes plus rows not yet flushed (the flushed float rows stay on disk).
+        """
+        return int(self._codes.nbytes + self._tail.nbytes)
+
+
+class LocalHNSWIndex(_PersistedIndex):
+    """
+    In-process approximate index backed by an hnswlib HNSW graph, persisted to a directory on flush().
+
+    Same API as LocalExactIndex. Requires the optional hnswlib package.
+    """
+
+    def __init__(self, path, dimension, max_elements=10000, m=16, ef_construction=200, ef_search=64):
+        try:
+            import hnswlib
+        except ImportError as e:
+            raise ImportError("The 'hnsw' vector backend requires hnswlib: pip install hnswlib") from e
+        self.path = path
+        self.dimension = dimension
+        self.ef_search = ef_search
+        self._lock = threading.RLock()
+        self._ids = []
+        self._labels = {}
+        self._metadata = {}
+        self._deleted = set()
+        os.makedirs(path, exist_ok=True)
+
+        self._graph = hnswlib.Index(space="cosine", dim=dimension)
+        graph_path = os.path.join(path, "graph.bin")
+        records_path = os.path.join(path, "records.json")
+        if os.path.exists(graph_path) and os.path.exists(records_path):
+            with open(records_path) as fp:
+                records = json.load(fp)
+            self._graph.load_index(graph_path, max_elements=max(max_elements, records["max_elements"]))
+            self._ids = records["ids"]
+            self._metadata = {int(label): metadata for label, metadata in records["metadata"].items()}
+            self._deleted = set(records["deleted"])
+        else:
+            self._graph.init_index(max_elements=max_elements, ef_construction=ef_construction, M=m)
+        self._labels = {vector_id: label for label, vector_id in enumerate(self._ids)}
+        self._attributes = AttributeIndex()
+        for label, metadata in self._metadata.items():
+            self._attributes.update(label, None, metadata)
+        self._graph.set_ef(ef_search)
+        self._disk_stamp = self._records_stamp()
+
+    def persist(self):
+        """
+        Write the graph and its records to disk.
+        """
+        with self._lock:
+            self._graph.save_index(os.path.join(self.path, "graph.bin"))
+            tmp_records = os.path.join(self.path, "records.tmp.json")
+            with open(tmp_records, "w") as fp:
+                json.dump({"ids": self._ids, "metadata": self._metadata, "deleted": sorted(self._deleted),
+                           "max_elements": self._graph.get_max_elements()}, fp)
+            os.replace(tmp_records, os.path.join(self.path, "records.json"))
+
+    def upsert(self, vectors, **kwargs):
+        with self._lock:
+            labels, rows = [], []
+            for vector_id, values, metadata in _as_records(vectors):
+                label = self._labels.get(vector_id)
+                if label is None:
+                    label = len(self._ids)
+                    self._labels[vector_id] = label
+                    self._ids.append(vector_id)
+                elif label in self._deleted:
+                    self._graph.unmark_deleted(label)
+                    self._deleted.discard(label)
+                self._attributes.update(label, self._metadata.get(label), metadata)
+                self._metadata[label] = metadata
+                labels.append(label)
+                rows.append(np.asarray(values, dtype=np.float32))
+            if rows:
+                needed = len(self._ids)
+                if needed > self._graph.get_max_elements():
+                    self._graph.resize_index(max(needed, 2 * self._graph.get_max_elements()))
+                self._graph.add_items(np.stack(rows), np.asarray(labels))
+                self._dirty = True
+            return {"upserted_count": len(rows)}
+
+    def _allowed(self, filter):
+        """
+        Return (labels passing the filter or None for all, number of live candidates).
+        """
+        if not filter:
+            return None, len(self._ids) - len(self._deleted)
+        positions = self._attributes.evaluate(filter)
+        if positions is not None:
+            allowed = set(positions.tolist()) - self._deleted
+        else:
+            allowed = {label for label, metadata in self._metadata.items() if matches_filter(metadata, filter)}
+        return allowed, len(allowed)
+
+    def query(self, vector, top_k=3, include_metadata=True, filter=None, **kwargs):
+        with self._lock:
+            allowed, live = self._allowed(filter)
+            if live <= 0:
+                return {"matches": []}
+            top_k = min(top_k, live)
+            self._graph.set_ef(max(self.ef_search, top_k))
+            labels, distances = self._graph.knn_query(
+                np.asarray(vector, dtype=np.float32), k=top_k,
+                filter=(lambda label: label in allowed) if allowed is not None else None,
+            )
+            matches = []
+            for label, distance in zip(labels[0], distances[0]):
+                match = {"id": self._ids[label], "score": float(1.0 - distance)}
+                if include_metadata:
+                    match["metadata"] = self._metadata.get(int(label), {})
+                matches.append(match)
+            return {"matches": matches}
+
+    def query_batch(self, vectors, top_k=3, include_metadata=True, filter=None, **kwargs):
+        """
+        Search many query vectors in one knn_query call over the graph.
+        """
+        if not len(vectors):
+            return []
+        with self._lock:
+            allowed, live = self._allowed(filter)
+            if live <= 0:
+                return [{"matches": []} for _ in vectors]
+            top_k = min(top_k, live)
+            self._graph.set_ef(max(self.ef_search, top_k))
+            labels, distances = self._graph.knn_query(
+                np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1), k=top_k,
+                filter=(lambda label: label in allowed) if allowed is not None else None,
+            )
+            responses = []
+            for row_labels, row_distances in zip(labels, distances):
+                matches = []
+                for label, distance in zip(row_labels, row_distances):
+                    match = {"id": self._ids[label], "score": float(1.0 - distance)}
+                    if include_metadata:
+                        match["metadata"] = self._metadata.get(int(label), {})
+                    matches.append(match)
+                responses.append({"matches": matches})
+            return responses
+
+    def delete(self, ids=None, delete_all=False, **kwargs):
+        with self._lock:
+            targets = self._ids if delete_all else (ids or [])
+            for vector_id in targets:
+                label = self._labels.get(vector_id)
+                if label is not None and label not in self._deleted:
+                    self._graph.mark_deleted(label)
+                    self._deleted.add(label)
+                    self._attributes.update(label, self._metadata.pop(label, None), None)
+                    self._dirty = True
+            return {}
+
+    def list(self, prefix=None, limit=100, **kwargs):
+        """
+        Yield pages of live ids starting with prefix, as Pinecone's Index.list does.
+        """
+        with self._lock:
+            ids = [vector_id for label, vector_id in enumerate(self._ids) if label not in self._deleted]
+        return _id_pages(ids, prefix, limit)
+
+    def describe_index_stats(self):
+        return {"dimension": self.dimension, "total_vector_count": len(self._ids) - len(self._deleted)}
+
+
+# Vector backends served from LOCAL_INDEX_DIR
+LOCAL_BACKENDS = ("local", "hnsw", "int8", "pq")
+
+
+def open_local_index(path, backend, dimension, rescore=True):
+    """
+    Open (or create) the local index for a backend name in LOCAL_BACKENDS.
+    Shared by the Streamlit app and Airflow ingestion so both see the same files.
+    """
+    if backend == "local":
+        return LocalExactIndex(path, dimension)
+    if backend == "hnsw":
+        return LocalHNSWIndex(path, dimension)
+    if backend in ("int8", "pq"):
+        return LocalQuantizedIndex(path, dimension, encoding=backend, rescore=rescore)
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -2,12 +2,19 @@ import streamlit as st
 import boto3
 from dotenv import load_dotenv
 import os
+import sys
+from itertools import islice
 from urllib.parse import urlparse
 from rag_agent import RAGAgent
 from arxiv_agent import ArxivAgent
 from web_search_agent import WebSearchAgent
 from report import generate_report
 from codelabs import generate_codelabs
+
+# Add the repository root to the Python path for the shared S3 catalog
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Airflow.scripts.s3_catalog import S3Catalog
+
 # Load environment variables
 load_dotenv()
 
@@ -17,6 +24,7 @@ AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 S3_PDFS_FOLDER = "pdfs/"  # Folder in the S3 bucket containing PDFs
+MAX_LISTED_PDFS = int(os.getenv("MAX_LISTED_PDFS", 5000))  # Cap on documents offered for selection
 
 # Initialize S3 client
 s3 = boto3.client(
@@ -25,6 +33,7 @@ s3 = boto3.client(
     aws_secret_access_key=AWS_SECRET_KEY,
     region_name=AWS_REGION
 )
+catalog = S3Catalog(s3, BUCKET_NAME)
 
 # Set up Streamlit page configuration with a wide layout
 st.set_page_config(page_title="PDF Research Application", layout="wide")
@@ -44,32 +53,26 @@ def fetch_pdf_data_from_s3():
     Handles missing keys and invalid data gracefully.
     """
     try:
-        # List objects in the specified S3 bucket and folder
-        response = s3.list_objects_v2(Bucket=BUCKET_NAME, Prefix=S3_PDFS_FOLDER)
-        
-        if 'Contents' not in response:
-            st.warning("No contents found in the specified S3 folder.")
-            return []
-
         pdf_files = []
 
-        for obj in response['Contents']:
+        # Stream the listing page by page; stop once the selection cap is reached
+        for obj in islice(catalog.iter_pdfs(S3_PDFS_FOLDER), MAX_LISTED_PDFS):
             file_key = obj.get('Key')  # Safely get 'Key'
             if not file_key:
                 continue
 
-            # Check if the file is a PDF
-            if file_key.endswith('.pdf'):
-                file_name = file_key.split('/')[-1]  # Extract file name
-                pdf_files.append({
-                    "title": file_name,
-                    "link": f"https://{BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{file_key}",
-                    "brief_summary": "No summary available",
-                    "image_link": None  # Placeholder for potential thumbnail
-                })
+            file_name = file_key.split('/')[-1]  # Extract file name
+            pdf_files.append({
+                "title": file_name,
+                "link": f"https://{BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{file_key}",
+                "brief_summary": "No summary available",
+                "image_link": None  # Placeholder for potential thumbnail
+            })
 
         if not pdf_files:
             st.warning("No PDF files found in the specified S3 folder.")
+        elif len(pdf_files) == MAX_LISTED_PDFS:
+            st.info(f"Showing the first {MAX_LISTED_PDFS} PDFs in the S3 folder.")
         return pdf_files
 
     except Exception as e:
@@ -153,17 +156,21 @@ def research_interface():
                 st.error("Invalid agent selected.")
                 return
 
-            # Run the agent and get results
-            results = agent.run()
+            # Run the agent and get results; RAG answers are rendered while they stream in
+            if isinstance(agent, RAGAgent):
+                results = stream_rag_answer(agent, selected_document_name)
+            else:
+                results = agent.run()
 
         except Exception as e:
             st.error(f"An error occurred while processing your request: {e}")
             return
 
         # Display results
-        st.subheader("Research Results")
-        st.write(f"**Document**: {selected_document_name}")
-        st.write(f"**Answer**: {results.get('answer', 'No answer generated.')}")
+        if not isinstance(agent, RAGAgent):
+            st.subheader("Research Results")
+            st.write(f"**Document**: {selected_document_name}")
+            st.write(f"**Answer**: {results.get('answer', 'No answer generated.')}")
         st.write(f"**Details**: {results.get('details', 'No details provided.')}")
 
         # Append to chat history
@@ -207,6 +214,34 @@ def research_interface():
         st.rerun()
 
 
+def stream_rag_answer(agent, document_name):
+    """
+    Render a RAG answer incrementally: sources as soon as retrieval finishes,
+    then the answer token by token. Returns the final results dictionary.
+    """
+    st.subheader("Research Results")
+    st.write(f"**Document**: {document_name}")
+    sources_placeholder = st.empty()
+    answer_placeholder = st.empty()
+    answer_placeholder.write("**Answer**: _retrieving context..._")
+    results = {}
+    answer = ""
+    for event, data in agent.stream():
+        if event == "retrieval":
+            with sources_placeholder.expander(f"Sources ({len(data['sources'])})"):
+                st.json(data["sources"])
+        elif event == "token":
+            answer += data["text"]
+            answer_placeholder.write(f"**Answer**: {answer}▌")
+        elif event == "done":
+            results = data
+    answer_placeholder.write(f"**Answer**: {results.get('answer', 'No answer generated.')}")
+    timings = results.get("timings", {})
+    if "first_token_ms" in timings:
+        st.caption(f"First token after {timings['first_token_ms']:.0f} ms, total {timings.get('total_ms', 0):.0f} ms")
+    return results
+
+
 # Main Interface
 def main():
     st.sidebar.title("Navigation")
@@ -1,4 +1,9 @@
 import os
+import time
+import atexit
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
 
@@ -8,19 +13,131 @@ load_dotenv()
 # Fetch API key and environment from environment variables
 pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_environment = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
-AI_AND_BIG_DATA_INDEX = os.getenv("AI_AND_BIG_DATA_INDEX_NAME")
-HORAN_ESG_RF_INDEX = os.getenv("HORAN_ESG_RF_INDEX_NAME")
+# Single index shared by all documents; chunks are partitioned by their pdf_name metadata
+SHARED_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "documents-index")
 EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 384))  # Default dimension set to 384 for your indexes
 
-# Initialize the Pinecone client
-pinecone_client = Pinecone(api_key=pinecone_api_key)
+# Vector store backend: "pinecone" (cloud), "local" (exact NumPy search), "hnsw" (approximate, needs hnswlib),
+# or "int8" / "pq" (search over scalar- or product-quantized codes)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+# Re-score the quantized shortlist with exact float vectors
+LOCAL_INDEX_RESCORE = os.getenv("LOCAL_INDEX_RESCORE", "true").lower() in ("1", "true", "yes")
+LOCAL_INDEX_DIR = os.path.expanduser(os.getenv("LOCAL_INDEX_DIR", "~/.cache/multi-agent-doc-search/indexes"))
+# How long a cached Pinecone index handle is trusted before it is revalidated with describe_index
+INDEX_HANDLE_TTL = float(os.getenv("INDEX_HANDLE_TTL", 300))
+# Concurrent Pinecone queries issued by query_embeddings_batch
+QUERY_CONCURRENCY = int(os.getenv("QUERY_CONCURRENCY", 8))
 
-# Function to retrieve a specific Pinecone index
-def get_pinecone_index(index_name):
+# The Pinecone client is created on first use so local backends work without credentials
+_pinecone_client = None
+_local_indexes = {}
+_local_indexes_lock = threading.Lock()
+_ensured_indexes = set()
+
+def get_pinecone_client():
     """
-    Retrieve or create a Pinecone index by name.
+    Return the shared Pinecone client, creating it on first use.
+    """
+    global _pinecone_client
+    if _pinecone_client is None:
+        _pinecone_client = Pinecone(api_key=pinecone_api_key)
+    return _pinecone_client
+
+class IndexRegistry:
+    """
+    Process-wide cache of Pinecone index handles keyed by index name.
+
+    A handle is built once from the index host returned by describe_index and
+    reused until ttl seconds have passed, so a steady-state query costs exactly
+    one data-plane call. Creation is never done here; see ensure_pinecone_index.
+    """
+
+    def __init__(self, ttl=INDEX_HANDLE_TTL):
+        self.ttl = ttl
+        self._handles = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_name):
+        entry = self._handles.get(index_name)
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return entry[0]
+        with self._lock:
+            entry = self._handles.get(index_name)
+            if entry is not None and time.monotonic() - entry[2] < self.ttl:
+                return entry[0]
+            pinecone_client = get_pinecone_client()
+            try:
+                host = pinecone_client.describe_index(index_name).host
+            except Exception as e:
+                self._handles.pop(index_name, None)
+                raise ValueError(f"Pinecone index '{index_name}' is not available: {e}")
+            # Keep the existing handle (and its connection pool) when the host has not moved
+            if entry is not None and entry[1] == host:
+                handle = entry[0]
+            else:
+                handle = pinecone_client.Index(index_name, host=host)
+            self._handles[index_name] = (handle, host, time.monotonic())
+            return handle
+
+    def invalidate(self, index_name=None):
+        with self._lock:
+            if index_name is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(index_name, None)
+
+
+index_registry = IndexRegistry()
+
+# Function to retrieve an index from the configured backend
+def get_index(index_name):
+    """
+    Retrieve an existing index by name on the configured vector backend.
+    All backends expose the Pinecone Index methods: upsert, query and delete.
+    """
+    if VECTOR_BACKEND == "pinecone":
+        return index_registry.get(index_name)
+    return get_local_index(index_name)
+
+def get_local_index(index_name, backend=None):
+    """
+    Open (or create) a persisted in-process index under LOCAL_INDEX_DIR, reopening
+    it when ingestion has flushed a newer copy to disk.
+    """
+    backend = backend or VECTOR_BACKEND
+    key = (backend, index_name)
+    with _local_indexes_lock:
+        index = _local_indexes.get(key)
+        if index is None or index.changed_on_disk():
+            from local_vector_index import open_local_index
+            if index is not None:
+                logging.info(f"Reloading local index '{index_name}' written by another process.")
+            path = os.path.join(LOCAL_INDEX_DIR, backend, index_name)
+            index = _local_indexes[key] = open_local_index(path, backend, EMBEDDING_DIMENSION,
+                                                           rescore=LOCAL_INDEX_RESCORE)
+        return index
+
+@atexit.register
+def flush_local_indexes():
+    """
+    Write every open local index's pending changes to disk. Local indexes keep
+    writes in memory, so writers flush after a batch; this also runs at exit.
+    """
+    with _local_indexes_lock:
+        indexes = list(_local_indexes.values())
+    for index in indexes:
+        index.flush()
+
+# Function to make sure a Pinecone index exists (write/setup path only)
+def ensure_pinecone_index(index_name):
+    """
+    Create a Pinecone index by name if it does not exist yet. Checked once per process.
     """
-    if index_name not in pinecone_client.list_indexes():
+    if index_name in _ensured_indexes:
+        return
+    pinecone_client = get_pinecone_client()
+    if index_name not in pinecone_client.list_indexes().names():
+        logging.info(f"Creating Pinecone index '{index_name}'...")
         # Specify serverless spec with cloud provider and region
         pinecone_client.create_index(
             name=index_name,
@@ -31,52 +148,137 @@ def get_pinecone_index(index_name):
                 region=pinecone_environment
             )
         )
-    return pinecone_client.Index(index_name)
+        index_registry.invalidate(index_name)
+    _ensured_indexes.add(index_name)
+
+# Function to retrieve a specific Pinecone index
+def get_pinecone_index(index_name):
+    """
+    Retrieve or create a Pinecone index by name.
+    """
+    ensure_pinecone_index(index_name)
+    return index_registry.get(index_name)
+
+# Function to map a document file name to its partition in the shared index
+def document_id(document_name):
+    """
+    Return the pdf_name the ingestion pipeline tags a document's chunks with,
+    e.g. "Horan ESG_RF_Brief_2022_Online.pdf" -> "horan-esg-rf-brief-2022-online".
+    """
+    name = os.path.basename(document_name)
+    if name.lower().endswith(".pdf"):
+        name = name[:-len(".pdf")]
+    return name.lower().replace("_", "-").replace(" ", "-")
 
-# Function to dynamically select the index based on document name
-def select_index(document_name):
+def document_filter(document_names=None):
     """
-    Map document names to the appropriate Pinecone index.
+    Build the metadata filter scoping a query to one document (a name), a set of
+    documents (a list of names) or the whole corpus (None).
     """
-    index_mapping = {
-        "ai-and-big-data-in-investments.pdf": AI_AND_BIG_DATA_INDEX,
-        "horan-esg-rf-brief-2022-online.pdf": HORAN_ESG_RF_INDEX,
-    }
-    if document_name in index_mapping:
-        return get_pinecone_index(index_mapping[document_name])
-    raise ValueError(f"No index mapping found for document: {document_name}")
+    if document_names is None:
+        return None
+    if isinstance(document_names, str):
+        return {"pdf_name": {"$eq": document_id(document_names)}}
+    return {"pdf_name": {"$in": sorted({document_id(name) for name in document_names})}}
+
+def chunk_filter(document_names=None, pages=None, sections=None, element_types=None, ingested_after=None):
+    """
+    Build a metadata filter from document scope plus chunk attributes recorded at
+    ingestion: pages=(first, last) keeps chunks overlapping that page range,
+    sections and element_types ("text", "table", "mixed") are lists of allowed
+    values, and ingested_after is a Unix timestamp. Returns None for no filter.
+    """
+    clauses = []
+    document_clause = document_filter(document_names)
+    if document_clause:
+        clauses.append(document_clause)
+    if pages:
+        first, last = pages
+        clauses.append({"page_end": {"$gte": int(first)}})
+        clauses.append({"page_start": {"$lte": int(last)}})
+    if sections:
+        clauses.append({"section": {"$in": list(sections)}})
+    if element_types:
+        clauses.append({"element_type": {"$in": list(element_types)}})
+    if ingested_after is not None:
+        clauses.append({"ingested_at": {"$gte": int(ingested_after)}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+# Function to select the shared multi-document index
+def select_index(document_name=None):
+    """
+    Return the shared index holding every document's chunks.
+    """
+    return get_index(SHARED_INDEX_NAME)
 
 # Function to store embeddings in Pinecone
 def store_embeddings(document_name, metadata, embeddings):
     """
-    Store embeddings in the Pinecone index corresponding to the document.
+    Store embeddings in the shared index, tagged with the document they belong to.
     """
+    if VECTOR_BACKEND == "pinecone":
+        ensure_pinecone_index(SHARED_INDEX_NAME)
     index = select_index(document_name)
-    document_id = metadata.get("id", "unknown_id")  # Use 'id' from metadata or fallback to 'unknown_id'
-    index.upsert(vectors=[(document_id, embeddings, metadata)])
+    vector_id = metadata.get("id", "unknown_id")  # Use 'id' from metadata or fallback to 'unknown_id'
+    metadata = {**metadata, "pdf_name": document_id(document_name)}
+    index.upsert(vectors=[(vector_id, embeddings, metadata)])
 
 # Function to retrieve embeddings from Pinecone
-def query_embeddings(document_name, query_vector, top_k=3):
+def query_embeddings(document_names, query_vector, top_k=3, **attribute_filters):
     """
-    Query embeddings from the Pinecone index corresponding to the document.
+    Query the shared index, restricted to one document, a list of documents,
+    or the whole corpus when document_names is None. One round trip either way.
+    attribute_filters are passed to chunk_filter (pages, sections, element_types, ingested_after).
     """
-    index = select_index(document_name)
-    response = index.query(top_k=top_k, vector=query_vector, include_metadata=True)
+    index = select_index()
+    query = {"top_k": top_k, "vector": query_vector, "include_metadata": True}
+    metadata_filter = chunk_filter(document_names, **attribute_filters)
+    if metadata_filter:
+        query["filter"] = metadata_filter
+    response = index.query(**query)
     if response and 'matches' in response:
         return response['matches']
     return []
 
+# Function to retrieve matches for many query vectors at once
+def query_embeddings_batch(document_names, query_vectors, top_k=3, **attribute_filters):
+    """
+    Query the shared index with many vectors under one filter and return one
+    match list per vector, in order. Local backends search all vectors with a
+    single matrix operation; Pinecone queries are issued concurrently.
+    """
+    index = select_index()
+    metadata_filter = chunk_filter(document_names, **attribute_filters)
+    if hasattr(index, "query_batch"):
+        responses = index.query_batch(query_vectors, top_k=top_k, include_metadata=True, filter=metadata_filter)
+        return [response["matches"] for response in responses]
+
+    def run_query(query_vector):
+        query = {"top_k": top_k, "vector": query_vector, "include_metadata": True}
+        if metadata_filter:
+            query["filter"] = metadata_filter
+        response = index.query(**query)
+        return response["matches"] if response and "matches" in response else []
+
+    with ThreadPoolExecutor(max_workers=max(1, min(QUERY_CONCURRENCY, len(query_vectors)))) as executor:
+        return list(executor.map(run_query, query_vectors))
+
 # Optional function to delete all data from a specific Pinecone index
 def delete_index_data(index_name):
     """
     Delete all data from the specified Pinecone index.
     """
-    index = get_pinecone_index(index_name)
+    index = get_index(index_name)
     index.delete(delete_all=True)
 
 # Optional function to list all indexes
 def list_all_indexes():
     """
-    List all available indexes in Pinecone.
+    List all available indexes on the configured backend.
     """
-    return pinecone_client.list_indexes()
+    if VECTOR_BACKEND == "pinecone":
+        return get_pinecone_client().list_indexes()
+    backend_dir = os.path.join(LOCAL_INDEX_DIR, VECTOR_BACKEND)
+    return sorted(os.listdir(backend_dir)) if os.path.isdir(backend_dir) else []
@@ -0,0 +1,102 @@
+import os
+import threading
+import logging
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Must match the model the ingestion pipeline embeds chunks with
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "paraphrase-MiniLM-L3-v2")
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """
+    Return the process-wide SentenceTransformer, loading it on first use.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                logging.info(f"Loading query embedding model '{EMBEDDING_MODEL_NAME}'...")
+                _model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return _model
+
+
+def normalize_query(query):
+    """
+    Normalize query text for cache lookups. The MiniLM tokenizer is uncased and
+    ignores repeated whitespace, so these variants encode to the same vector.
+    """
+    return " ".join(query.lower().split())
+
+
+class QueryVectorCache:
+    """
+    Bounded, thread-safe LRU of query vectors keyed by normalized query text.
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+query_vector_cache = QueryVectorCache()
+
+
+def encode_query(query):
+    """
+    Return the embedding of a query as a list of floats, served from the LRU when possible.
+    """
+    key = normalize_query(query)
+    vector = query_vector_cache.get(key)
+    if vector is None:
+        vector = get_embedding_model().encode(key, convert_to_numpy=True).tolist()
+        query_vector_cache.put(key, vector)
+    return vector
+
+
+def encode_queries(queries, batch_size=64):
+    """
+    Return one embedding per query, encoding every cache miss in a single batched model call.
+    """
+    keys = [normalize_query(query) for query in queries]
+    vectors = [query_vector_cache.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+    if missing:
+        encoded = get_embedding_model().encode(missing, batch_size=batch_size, convert_to_numpy=True)
+        fresh = dict(zip(missing, (vector.tolist() for vector in encoded)))
+        for key, vector in fresh.items():
+            query_vector_cache.put(key, vector)
+        vectors = [vector if vector is not None else fresh[key] for key, vector in zip(keys, vectors)]
+    return vectors
@@ -1,26 +1,46 @@
 import os
 from dotenv import load_dotenv
-from pinecone import Pinecone
 import boto3
 import openai
 import logging
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from chunk_store import ChunkStore, ChunkTextCache, chunk_cache_key
+from async_clients import get_openai_client, get_sync_openai_client, run_blocking
+from query_encoder import encode_queries, encode_query
+from sparse_index_store import SparseIndexStore
+from reranker import RERANK_BUDGET_MS, rerank
+from local_vector_index import matches_filter
+import pinecone_utils
 
 # Load environment variables
 load_dotenv()
 
 # API Keys and Environment Variables
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT", "us-east-1")
-AI_AND_BIG_DATA_INDEX_NAME = os.getenv("AI_AND_BIG_DATA_INDEX_NAME")
-HORAN_ESG_RF_INDEX_NAME = os.getenv("HORAN_ESG_RF_INDEX_NAME")
 AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
 AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 BUCKET_NAME = os.getenv("S3_BUCKET_NAME")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+SHARD_CACHE_DIR = os.getenv("SHARD_CACHE_DIR")  # Optional local cache for packed chunk shards
+CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", 2048))  # Chunk texts kept in memory
+CHUNK_CACHE_DIR = os.path.expanduser(os.getenv("CHUNK_CACHE_DIR", "~/.cache/multi-agent-doc-search/chunks"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))  # Prompt tokens reserved for retrieved chunks
+SPARSE_INDEX_CACHE_DIR = os.path.expanduser(os.getenv("SPARSE_INDEX_CACHE_DIR", "~/.cache/multi-agent-doc-search/bm25"))
+SPARSE_INDEX_TTL = float(os.getenv("SPARSE_INDEX_TTL", 300))  # Seconds before a BM25 index is re-checked against S3
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "dense")  # "dense" or "hybrid" (BM25 + dense)
+RRF_K = int(os.getenv("RRF_K", 60))
+TOP_K = 3
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))  # Per-retriever candidates fused in hybrid mode
+RERANK_ENABLED = os.getenv("RAG_RERANK", "false").lower() in ("1", "true", "yes")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 10))  # First-stage candidates scored by the cross-encoder
+FETCH_CONCURRENCY = int(os.getenv("CHUNK_FETCH_CONCURRENCY", 8))
+BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", 8))  # Chat completions in flight per batch
+BATCH_WINDOW = int(os.getenv("RAG_BATCH_WINDOW", 128))  # Questions retrieved together; bounds memory per batch
 
 # Initialize clients
-pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
 s3_client = boto3.client(
     "s3",
     aws_access_key_id=AWS_ACCESS_KEY,
@@ -28,58 +48,154 @@ s3_client = boto3.client(
     region_name=AWS_REGION
 )
 openai.api_key = OPENAI_API_KEY
+chunk_text_cache = ChunkTextCache(max_entries=CHUNK_CACHE_SIZE, disk_dir=CHUNK_CACHE_DIR or None)
+chunk_store = ChunkStore(s3_client, BUCKET_NAME, cache_dir=SHARD_CACHE_DIR, text_cache=chunk_text_cache)
+sparse_store = SparseIndexStore(s3_client, BUCKET_NAME, SPARSE_INDEX_CACHE_DIR, ttl=SPARSE_INDEX_TTL)
+fetch_executor = ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY, thread_name_prefix="chunk-fetch")
+
+def reciprocal_rank_fusion(rankings, k=RRF_K, top_k=TOP_K):
+    """
+    Merge ranked match lists by reciprocal rank fusion: each match scores
+    sum(1 / (k + rank)) over the lists it appears in, so raw BM25 and cosine
+    scores never have to be put on the same scale.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            entry = fused.setdefault(match["id"], {"id": match["id"], "score": 0.0, "metadata": match.get("metadata", {})})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda match: match["score"], reverse=True)[:top_k]
+
+@lru_cache(maxsize=1)
+def get_prompt_encoding():
+    """
+    Return the tokenizer of the chat model, loaded on first use.
+    """
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def assemble_context(texts, token_budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Pack chunk texts, best first, into a context of at most token_budget tokens.
+    Whole chunks are kept; only a top chunk that alone exceeds the budget is truncated.
+    """
+    encoding = get_prompt_encoding()
+    separator = "\n\n---\n\n"
+    separator_tokens = len(encoding.encode(separator))
+    parts, used = [], 0
+    for text in texts:
+        tokens = encoding.encode(text)
+        cost = len(tokens) + (separator_tokens if parts else 0)
+        if used + cost > token_budget:
+            if not parts:
+                parts.append(encoding.decode(tokens[:token_budget]))
+            break
+        parts.append(text)
+        used += cost
+    return separator.join(parts)
+
+def retrieve_batch(queries, document_name=None, top_k=TOP_K, filters=None):
+    """
+    Dense retrieval for many queries: one batched encode, then one batched
+    search. Returns a list of match lists, one per query, for offline
+    evaluation and report generation.
+    """
+    if not queries:
+        return []
+    query_vectors = encode_queries(queries)
+    results = pinecone_utils.query_embeddings_batch(document_name, query_vectors, top_k=top_k, **(filters or {}))
+    return [[{"id": match["id"], "score": match["score"], "metadata": match["metadata"]} for match in matches]
+            for matches in results]
 
 class RAGAgent:
-    def __init__(self, document_name, query):
+    def __init__(self, document_name, query, retrieval_mode=None, rerank=None, filters=None):
+        """
+        document_name may be a single document, a list of documents, or None to
+        search the whole corpus. All documents share one index.
+        retrieval_mode is "dense" or "hybrid"; it defaults to RAG_RETRIEVAL_MODE.
+        rerank enables the cross-encoder stage; it defaults to RAG_RERANK.
+        filters narrows retrieval by chunk attributes; see pinecone_utils.chunk_filter.
+        """
         self.document_name = document_name
         self.query = query
+        self.index_name = pinecone_utils.SHARED_INDEX_NAME
+        self.metadata_filter = pinecone_utils.chunk_filter(document_name, **(filters or {}))
+        self.retrieval_mode = retrieval_mode or RETRIEVAL_MODE
+        self.rerank = RERANK_ENABLED if rerank is None else rerank
 
-        # Map document names to corresponding Pinecone indexes
-        if document_name == "ai-and-big-data-in-investments.pdf":
-            self.index_name = AI_AND_BIG_DATA_INDEX_NAME
-        elif document_name == "horan-esg-rf-brief-2022-online.pdf":
-            self.index_name = HORAN_ESG_RF_INDEX_NAME
-        else:
-            raise ValueError(f"No index mapped for document: {document_name}")
-
-    def get_or_create_pinecone_index(self, dimension=384):
+    def get_or_create_pinecone_index(self):
         """
-        Retrieve or create a Pinecone index for the specified document.
+        Retrieve the shared index from the process-wide handle registry. The index
+        is created by ingestion, so no control-plane call is made per query.
         """
-        if self.index_name not in pinecone_client.list_indexes().names():
-            logging.info(f"Index '{self.index_name}' does not exist. Creating a new index...")
-            pinecone_client.create_index(
-                name=self.index_name,
-                dimension=dimension,  # Dimension for embeddings
-                metric='cosine'
-            )
-            logging.info(f"Index '{self.index_name}' created successfully.")
-        else:
-            logging.info(f"Index '{self.index_name}' already exists.")
-        return pinecone_client.Index(self.index_name)
+        return pinecone_utils.get_index(self.index_name)
 
-    def fetch_from_pinecone(self):
+    def fetch_from_pinecone(self, top_k=TOP_K):
         """
-        Fetch metadata from Pinecone for the given query.
+        Fetch metadata from Pinecone for the given query, scoped to the selected documents.
         """
         index = self.get_or_create_pinecone_index()
-        query_vector = [0.0] * 384  # Placeholder for query vector; actual implementation may vary
-        response = index.query(
-            vector=query_vector, top_k=3, include_metadata=True
-        )
+        query_vector = encode_query(self.query)
+        query = {"vector": query_vector, "top_k": top_k, "include_metadata": True}
+        if self.metadata_filter:
+            query["filter"] = self.metadata_filter
+        response = index.query(**query)
         if "matches" in response:
-            return response["matches"]
+            return [{"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+                    for match in response["matches"]]
         else:
             return []
 
-    def fetch_text_from_s3(self, s3_key):
+    def fetch_from_bm25(self, top_k=HYBRID_CANDIDATES):
+        """
+        Fetch keyword matches from the selected documents' BM25 indexes.
+        """
+        if self.document_name is None:
+            return []
+        names = [self.document_name] if isinstance(self.document_name, str) else self.document_name
+        pdf_names = sorted({pinecone_utils.document_id(name) for name in names})
+        matches = sparse_store.search(pdf_names, self.query, top_k=top_k)
+        return [match for match in matches if matches_filter(match["metadata"], self.metadata_filter)]
+
+    def fetch_matches(self, top_k=TOP_K):
+        """
+        Retrieve the top matches using the configured retrieval mode.
+        """
+        if self.retrieval_mode != "hybrid":
+            return self.fetch_from_pinecone(top_k=top_k)
+        if self.document_name is None:
+            # Sparse indexes are per document; whole-corpus keyword search is not supported
+            logging.info("Hybrid retrieval needs selected documents; using dense retrieval only.")
+            return self.fetch_from_pinecone(top_k=top_k)
+        candidates = max(HYBRID_CANDIDATES, top_k)
+        dense = self.fetch_from_pinecone(top_k=candidates)
+        sparse = self.fetch_from_bm25(top_k=candidates)
+        return reciprocal_rank_fusion([dense, sparse], top_k=top_k)
+
+    def fetch_texts(self, matches):
+        """
+        Fetch the chunk texts of several matches concurrently, in match order.
+        Returns (matches, texts) without the matches whose text could not be
+        fetched, e.g. because their document is being re-ingested.
+        """
+        def fetch(match):
+            try:
+                return self.fetch_text_from_s3(match["metadata"])
+            except ValueError as e:
+                logging.warning(f"Dropping match {match['id']}: {e}")
+                return None
+
+        fetched = [(match, text) for match, text in zip(matches, fetch_executor.map(fetch, matches))
+                   if text is not None]
+        return [match for match, _ in fetched], [text for _, text in fetched]
+
+    def fetch_text_from_s3(self, metadata):
         """
-        Fetch the text file content from S3 using the provided S3 key.
+        Fetch a chunk's text from S3 using the shard key, offset and length in its metadata.
         """
+        s3_key = metadata.get("s3_key")
         try:
-            s3_response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_key)
-            text = s3_response["Body"].read().decode("utf-8")
-            return text
+            return chunk_store.fetch(metadata)
         except Exception as e:
             raise ValueError(f"Error fetching data from S3 for key '{s3_key}': {str(e)}")
 
@@ -90,32 +206,298 @@ class RAGAgent:
         try:
             response = openai.ChatCompletion.create(
                 model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": f"Context: {context}\n\nQuestion: {self.query}"}
-                ],
+                messages=self.chat_messages(context),
                 max_tokens=500
             )
             return response["choices"][0]["message"]["content"].strip()
         except Exception as e:
             raise ValueError(f"Error processing query with OpenAI: {str(e)}")
 
-    def run(self):
+    async def aprocess_query_with_openai(self, context):
         """
-        Execute the RAG process to retrieve an answer to the query.
+        Process the query with the chat model over the shared async client.
+        """
+        try:
+            response = await get_openai_client().chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=self.chat_messages(context),
+                max_tokens=500
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            raise ValueError(f"Error processing query with OpenAI: {str(e)}")
+
+    def build_context(self, timings):
         """
-        # Fetch matches from Pinecone
-        matches = self.fetch_from_pinecone()
+        Retrieve, fetch, optionally re-rank and pack the chunks for the prompt.
+        Returns (context, None), or (None, message) when nothing usable was found.
+        """
+        started = time.perf_counter()
+
+        # Fetch matches from Pinecone (and BM25 in hybrid mode), over-fetching for re-ranking
+        matches = self.fetch_matches(top_k=RERANK_CANDIDATES if self.rerank else TOP_K)
+        timings["retrieval_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if not matches:
+            return None, "No relevant matches found in Pinecone index."
+        matches = [match for match in matches if (match.get("metadata") or {}).get("s3_key")]
+        if not matches:
+            return None, "No S3 key found in the metadata of the top match."
+        self.matches = matches
+
+        # Fetch every candidate's text concurrently; repeats are served from the chunk cache
+        stage = time.perf_counter()
+        matches, texts = self.fetch_texts(matches)
+        timings["fetch_ms"] = round((time.perf_counter() - stage) * 1000, 1)
         if not matches:
-            return {"answer": "No relevant matches found in Pinecone index.", "details": ""}
+            raise ValueError("None of the matched chunks could be fetched from S3.")
+
+        if self.rerank:
+            stage = time.perf_counter()
+            by_id = {match["id"]: text for match, text in zip(matches, texts)}
+            matches, reranked = rerank(self.query, matches, texts, top_n=TOP_K, budget_ms=RERANK_BUDGET_MS)
+            texts = [by_id[match["id"]] for match in matches]
+            timings["rerank_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+            timings["reranked"] = reranked
+
+        # Pack the top chunks into the prompt under the token budget
+        self.matches = matches[:TOP_K]
+        return assemble_context(texts[:TOP_K]), None
+
+    def sources(self):
+        """
+        Summarize the matches behind the current context for display: id, score and location.
+        """
+        fields = ("pdf_name", "page_start", "page_end", "section", "element_type")
+        return [{"id": match["id"], "score": match.get("rerank_score", match["score"]),
+                 **{field: match["metadata"][field] for field in fields if field in match["metadata"]}}
+                for match in getattr(self, "matches", [])]
 
-        # Fetch context from S3 using the S3 key of the top match
-        s3_key = matches[0]["metadata"].get("s3_key")
-        if not s3_key:
-            return {"answer": "No S3 key found in the metadata of the top match.", "details": ""}
+    def chat_messages(self, context):
+        """
+        Build the chat prompt for the query and its retrieved context.
+        """
+        return [
+            {"role": "system", "content": "You are a helpful assistant."},
+            {"role": "user", "content": f"Context: {context}\n\nQuestion: {self.query}"}
+        ]
 
-        context = self.fetch_text_from_s3(s3_key)
+    def run(self):
+        """
+        Execute the RAG process to retrieve an answer to the query.
+        """
+        timings = {}
+        started = time.perf_counter()
+        context, failure = self.build_context(timings)
+        if failure:
+            return {"answer": failure, "details": "", "timings": timings}
 
         # Generate the final answer using OpenAI
+        stage = time.perf_counter()
         answer = self.process_query_with_openai(context)
-        return {"answer": answer, "details": context}
+        timings["generation_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"answer": answer, "details": context, "timings": timings}
+
+    async def arun(self):
+        """
+        Execute the RAG process without blocking the event loop: retrieval runs on
+        the blocking-call pool, generation awaits the async OpenAI client.
+        """
+        timings = {}
+        started = time.perf_counter()
+        context, failure = await run_blocking(self.build_context, timings)
+        if failure:
+            return {"answer": failure, "details": "", "timings": timings}
+
+        stage = time.perf_counter()
+        answer = await self.aprocess_query_with_openai(context)
+        timings["generation_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return {"answer": answer, "details": context, "timings": timings}
+
+    def stream(self):
+        """
+        Execute the RAG process, yielding (event, data) pairs as results become available:
+        "retrieval" with the sources, one "token" per model delta, then "done" with the
+        full answer and timings (including first_token_ms).
+        """
+        timings = {}
+        started = time.perf_counter()
+        context, failure = self.build_context(timings)
+        if failure:
+            yield "done", {"answer": failure, "details": "", "timings": timings}
+            return
+        yield "retrieval", {"sources": self.sources(), "timings": dict(timings)}
+
+        stage = time.perf_counter()
+        parts = []
+        try:
+            for chunk in get_sync_openai_client().chat.completions.create(
+                    model="gpt-3.5-turbo", messages=self.chat_messages(context), max_tokens=500, stream=True):
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        timings["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+        except Exception as e:
+            raise ValueError(f"Error processing query with OpenAI: {str(e)}")
+        timings["generation_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        yield "done", {"answer": "".join(parts).strip(), "details": context, "timings": timings}
+
+    async def astream(self):
+        """
+        Async counterpart of stream(): retrieval runs on the blocking-call pool and
+        tokens are relayed from the async OpenAI client as they arrive.
+        """
+        timings = {}
+        started = time.perf_counter()
+        context, failure = await run_blocking(self.build_context, timings)
+        if failure:
+            yield "done", {"answer": failure, "details": "", "timings": timings}
+            return
+        yield "retrieval", {"sources": self.sources(), "timings": dict(timings)}
+
+        stage = time.perf_counter()
+        parts = []
+        try:
+            response = await get_openai_client().chat.completions.create(
+                model="gpt-3.5-turbo", messages=self.chat_messages(context), max_tokens=500, stream=True)
+            async for chunk in response:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if not parts:
+                        timings["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                    parts.append(delta)
+                    yield "token", {"text": delta}
+        except Exception as e:
+            raise ValueError(f"Error processing query with OpenAI: {str(e)}")
+        timings["generation_ms"] = round((time.perf_counter() - stage) * 1000, 1)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        yield "done", {"answer": "".join(parts).strip(), "details": context, "timings": timings}
+
+def build_batch_contexts(items, top_k=TOP_K):
+    """
+    Build prompt contexts for many (document_name, query) pairs at once: one
+    batched encode, one batched search per document (documents in parallel),
+    and each distinct chunk fetched once however many questions share it.
+    Returns one (context, failure, error) triple per item: context and failure
+    as in RAGAgent.build_context, and error set instead when the item's search
+    raised or none of its chunks could be fetched. Chunks that fail to fetch
+    are left out of the context, and other items are unaffected.
+    """
+    query_vectors = encode_queries([query for _, query in items])
+    groups = {}
+    for position, (document_name, _) in enumerate(items):
+        groups.setdefault(document_name, []).append(position)
+
+    def search(group):
+        document_name, positions = group
+        try:
+            results = pinecone_utils.query_embeddings_batch(
+                document_name, [query_vectors[position] for position in positions], top_k=top_k)
+            return positions, results, None
+        except Exception as e:
+            return positions, None, e
+
+    matches = [None] * len(items)
+    errors = [None] * len(items)
+    for positions, results, error in fetch_executor.map(search, groups.items()):
+        for offset, position in enumerate(positions):
+            if error is not None:
+                errors[position] = ValueError(f"Error querying the vector index: {error}")
+                continue
+            matches[position] = [{"id": match["id"], "score": match["score"], "metadata": match["metadata"]}
+                                 for match in results[offset] if (match["metadata"] or {}).get("s3_key")]
+
+    unique = {}
+    for item_matches in matches:
+        for match in item_matches or []:
+            unique.setdefault(chunk_cache_key(match["metadata"]), match["metadata"])
+
+    def fetch(metadata):
+        try:
+            return chunk_store.fetch(metadata), None
+        except Exception as e:
+            return None, ValueError(f"Error fetching data from S3 for key '{metadata.get('s3_key')}': {str(e)}")
+
+    fetched = dict(zip(unique, fetch_executor.map(fetch, unique.values())))
+
+    contexts = []
+    for item_matches, error in zip(matches, errors):
+        if error is not None:
+            contexts.append((None, None, error))
+            continue
+        if not item_matches:
+            contexts.append((None, "No relevant matches found in Pinecone index.", None))
+            continue
+        results = [fetched[chunk_cache_key(match["metadata"])] for match in item_matches]
+        texts = [text for text, error in results if error is None]
+        if texts:
+            contexts.append((assemble_context(texts), None, None))
+        else:
+            contexts.append((None, None, next(error for _, error in results)))
+    return contexts
+
+async def arun_batch(items, concurrency=BATCH_LLM_CONCURRENCY, window=BATCH_WINDOW):
+    """
+    Answer many (document_name, query) pairs, yielding one result dict per item
+    as soon as it is ready (in completion order, tagged with its index).
+    Retrieval runs window items at a time, the next window's while the current
+    one's answers are being generated, so at most two windows of contexts are
+    held; at most concurrency chat completions are in flight. Closing the
+    generator (e.g. when the client disconnects) cancels the pending answers.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(index, document_name, query, context, failure, error):
+        result = {"index": index, "document_name": document_name, "query": query}
+        if error is not None:
+            return {**result, "error": str(error)}
+        if failure:
+            return {**result, "answer": failure, "details": ""}
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                text = await RAGAgent(document_name, query).aprocess_query_with_openai(context)
+        except Exception as e:
+            return {**result, "error": str(e)}
+        generation_ms = round((time.perf_counter() - started) * 1000, 1)
+        return {**result, "answer": text, "details": context, "timings": {"generation_ms": generation_ms}}
+
+    answers = set()
+    retrieval, retrieval_start, next_start = None, 0, 0
+    try:
+        while True:
+            if retrieval is None and next_start < len(items) and len(answers) <= window:
+                retrieval_start, next_start = next_start, next_start + window
+                retrieval = asyncio.ensure_future(
+                    run_blocking(build_batch_contexts, items[retrieval_start:next_start]))
+            if retrieval is None and not answers:
+                return
+            done, _ = await asyncio.wait(answers | ({retrieval} if retrieval else set()),
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if retrieval in done:
+                done.discard(retrieval)
+                batch = items[retrieval_start:retrieval_start + window]
+                try:
+                    contexts = retrieval.result()
+                except Exception as e:
+                    # Only the shared batched encode fails the whole window; searches and fetches fail per item
+                    contexts = None
+                    for index, (document_name, query) in enumerate(batch, start=retrieval_start):
+                        yield {"index": index, "document_name": document_name, "query": query, "error": str(e)}
+                retrieval = None
+                for index, ((document_name, query), outcome) in enumerate(zip(batch, contexts or []),
+                                                                         start=retrieval_start):
+                    answers.add(asyncio.ensure_future(answer(index, document_name, query, *outcome)))
+            for task in done:
+                answers.discard(task)
+                yield task.result()
+    finally:
+        # Reached on client disconnect too; chat completions for an abandoned batch are not worth paying for
+        for task in answers:
+            task.cancel()
+        if retrieval is not None:
+            retrieval.cancel()
@@ -0,0 +1,87 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+RERANK_MODEL_NAME = os.getenv("RERANK_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 500))
+RERANK_WORKERS = int(os.getenv("RERANK_WORKERS", 1))  # Concurrent scoring passes; each is CPU-bound
+
+_model = None
+_model_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=RERANK_WORKERS, thread_name_prefix="rerank")
+# One slot per worker, held for the whole pass. A pass that outlives its budget cannot be
+# cancelled and keeps its slot until it finishes, so new requests skip re-ranking instead
+# of queueing behind it and spending their own budget waiting.
+_worker_slots = threading.BoundedSemaphore(RERANK_WORKERS)
+
+
+def get_rerank_model():
+    """
+    Return the process-wide CrossEncoder, loading it on first use.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+                logging.info(f"Loading re-ranking model '{RERANK_MODEL_NAME}'...")
+                _model = CrossEncoder(RERANK_MODEL_NAME, device="cpu")
+    return _model
+
+
+def score_pairs(query, texts):
+    """
+    Score (query, text) pairs with the cross-encoder in one batched forward pass.
+    """
+    model = get_rerank_model()
+    return model.predict([(query, text) for text in texts], batch_size=RERANK_BATCH_SIZE,
+                         show_progress_bar=False).tolist()
+
+
+def _score_in_slot(query, texts):
+    try:
+        return score_pairs(query, texts)
+    finally:
+        _worker_slots.release()
+
+
+def rerank(query, candidates, texts, top_n=3, budget_ms=RERANK_BUDGET_MS):
+    """
+    Reorder candidates by cross-encoder relevance and keep the best top_n.
+
+    candidates and texts are parallel lists in first-stage order. If scoring
+    does not finish within budget_ms, or every worker is still busy with an
+    earlier pass, the first-stage order is kept instead. The model is loaded
+    before the budget starts. Returns (matches, reranked) where reranked says
+    whether re-ranking was applied.
+    """
+    if len(candidates) <= 1:
+        return candidates[:top_n], False
+    get_rerank_model()
+    if not _worker_slots.acquire(blocking=False):
+        logging.warning("Re-ranking workers are busy with earlier passes; keeping first-stage order.")
+        return candidates[:top_n], False
+    try:
+        # A free slot means a free worker, so the pass starts now and the budget times only the pass
+        future = _executor.submit(_score_in_slot, query, texts)
+    except Exception:
+        _worker_slots.release()
+        raise
+    try:
+        scores = future.result(timeout=budget_ms / 1000.0 if budget_ms else None)
+    except FutureTimeout:
+        logging.warning(f"Re-ranking exceeded its {budget_ms:.0f} ms budget; keeping first-stage order.")
+        return candidates[:top_n], False
+    ranked = sorted(zip(scores, range(len(candidates))), key=lambda pair: pair[0], reverse=True)
+    matches = []
+    for score, position in ranked[:top_n]:
+        match = dict(candidates[position])
+        match["rerank_score"] = float(score)
+        matches.append(match)
+    return matches, True
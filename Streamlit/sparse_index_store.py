@@ -0,0 +1,124 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import time
+import logging
+
+# Add the repository root to the Python path for the shared BM25 index format
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from Airflow.scripts.bm25_index import BM25_FILES, BM25_VERSION_METADATA, BM25Index, bm25_prefix
+
+
+class SparseIndexStore:
+    """
+    Serves BM25 searches over the per-document inverted indexes built at ingestion.
+
+    Each document's index files are downloaded from S3 once per ETag into
+    cache_dir and memory-mapped from there, so a query touches only local pages.
+    The vocab.json ETag is re-checked every ttl seconds, so a re-ingested
+    document's new index (and its new chunk offsets) replaces the old one.
+    Documents are refreshed under their own locks, so a slow download only
+    holds up queries on that document, and a download that raced a
+    re-ingestion is discarded rather than served.
+    """
+
+    def __init__(self, s3_client, bucket, cache_dir, ttl=300):
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._indexes = {}
+        self._document_locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, pdf_name):
+        """
+        Return the BM25Index for a document, or None if it has none.
+        """
+        entry = self._indexes.get(pdf_name)
+        if entry is not None and time.monotonic() - entry[2] < self.ttl:
+            return entry[0]
+        with self._lock:
+            document_lock = self._document_locks.setdefault(pdf_name, threading.Lock())
+        with document_lock:
+            # Another query may have refreshed the document while this one waited
+            entry = self._indexes.get(pdf_name)
+            if entry is not None and time.monotonic() - entry[2] < self.ttl:
+                return entry[0]
+            etag = self._etag(pdf_name)
+            if entry is not None and entry[1] == etag:
+                index = entry[0]
+            elif etag:
+                index = self._load(pdf_name, etag)
+                if index is None and entry is not None:
+                    # Re-ingestion in progress; keep serving the previous index until the next check
+                    index, etag = entry[0], entry[1]
+            else:
+                index = None
+            self._indexes[pdf_name] = (index, etag, time.monotonic())
+            return index
+
+    def _etag(self, pdf_name):
+        try:
+            return self.s3.head_object(Bucket=self.bucket, Key=f"{bm25_prefix(pdf_name)}vocab.json")["ETag"].strip('"')
+        except Exception as e:
+            logging.info(f"No BM25 index for '{pdf_name}': {e}")
+            return None
+
+    def _load(self, pdf_name, etag):
+        """
+        Return the document's index at etag, downloading it if needed, or None
+        when its files changed in S3 during the download.
+        """
+        prefix = bm25_prefix(pdf_name)
+        document_dir = os.path.join(self.cache_dir, pdf_name)
+        local_dir = os.path.join(document_dir, etag)
+        if not os.path.exists(os.path.join(local_dir, "vocab.json")):
+            os.makedirs(document_dir, exist_ok=True)
+            tmp_dir = tempfile.mkdtemp(prefix=".part-", dir=document_dir)
+            try:
+                versions, vocab_etag = set(), None
+                # vocab.json is last in BM25_FILES and uploaded last, so it is fetched last too
+                for name in BM25_FILES:
+                    response = self.s3.get_object(Bucket=self.bucket, Key=f"{prefix}{name}")
+                    versions.add((response.get("Metadata") or {}).get(BM25_VERSION_METADATA))
+                    vocab_etag = response["ETag"].strip('"')
+                    with open(os.path.join(tmp_dir, name), "wb") as fp:
+                        for block in iter(lambda: response["Body"].read(1 << 20), b""):
+                            fp.write(block)
+                if vocab_etag != etag or len(versions) > 1:
+                    logging.info(f"BM25 index for '{pdf_name}' changed during download; retrying later.")
+                    return None
+                shutil.rmtree(local_dir, ignore_errors=True)
+                try:
+                    os.replace(tmp_dir, local_dir)
+                except OSError:
+                    # Another process finished the same download first
+                    if not os.path.exists(os.path.join(local_dir, "vocab.json")):
+                        raise
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        index = BM25Index(local_dir)
+        # Earlier versions are no longer served; open memory maps keep their pages until released
+        for entry in os.scandir(document_dir):
+            if entry.is_dir() and entry.name != etag and not entry.name.startswith(".part-"):
+                shutil.rmtree(entry.path, ignore_errors=True)
+        return index
+
+    def search(self, pdf_names, query, top_k=10):
+        """
+        Return the top_k BM25 matches across the given documents, in the same
+        shape as vector-store matches: {"id", "score", "metadata"}.
+        """
+        matches = []
+        for pdf_name in pdf_names:
+            index = self.get(pdf_name)
+            if index is None:
+                continue
+            for chunk_id, score in index.search(query, top_k=top_k):
+                metadata = dict(index.chunks[chunk_id])
+                matches.append({"id": metadata.pop("id"), "score": score, "metadata": metadata})
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return matches[:top_k]
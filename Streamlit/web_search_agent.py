@@ -1,10 +1,13 @@
 import os
 from tavily import TavilyClient
 from dotenv import load_dotenv
+from async_clients import get_http_client
 
 # Load environment variables
 load_dotenv()
 
+TAVILY_SEARCH_URL = "https://api.tavily.com/search"
+
 class WebSearchAgent:
     def __init__(self, selected_document, user_query, num_results=10):
         """
@@ -34,18 +37,43 @@ class WebSearchAgent:
             list: A list of search results, each containing a title, URL, and snippet.
         """
         try:
-            results = self.client.search(query=self.user_query, limit=self.num_results)
-            return [
-                {
-                    "title": result.get("title", "No title available"),
-                    "url": result.get("url", "No URL available"),
-                    "snippet": result.get("snippet", "No snippet available")
-                }
-                for result in results.get("results", [])
-            ]
+            results = self.client.search(query=self.user_query, max_results=self.num_results)
+            return self.parse_results(results)
         except Exception as e:
             return {"error": f"Error during Tavily search: {str(e)}"}
 
+    async def asearch(self):
+        """
+        Perform a web search against the Tavily API over the shared pooled HTTP client.
+
+        Returns:
+            list: A list of search results, each containing a title, URL, and snippet.
+        """
+        try:
+            response = await get_http_client().post(
+                TAVILY_SEARCH_URL,
+                json={"api_key": self.api_key, "query": self.user_query, "max_results": self.num_results},
+                headers={"Authorization": f"Bearer {self.api_key}"},
+            )
+            response.raise_for_status()
+            return self.parse_results(response.json())
+        except Exception as e:
+            return {"error": f"Error during Tavily search: {str(e)}"}
+
+    @staticmethod
+    def parse_results(results):
+        """
+        Extract title, URL and snippet from a Tavily search response.
+        """
+        return [
+            {
+                "title": result.get("title", "No title available"),
+                "url": result.get("url", "No URL available"),
+                "snippet": result.get("snippet") or result.get("content", "No snippet available")
+            }
+            for result in results.get("results", [])
+        ]
+
     def run(self):
         """
         Execute the web search agent logic.
@@ -54,7 +82,22 @@ class WebSearchAgent:
             dict: A dictionary containing the search results or an error message.
         """
         print(f"Running WebSearchAgent for document: {self.selected_document} and query: {self.user_query}")
-        search_results = self.search()
+        return self.format_results(self.search())
+
+    async def arun(self):
+        """
+        Execute the web search agent logic asynchronously.
+
+        Returns:
+            dict: A dictionary containing the search results or an error message.
+        """
+        return self.format_results(await self.asearch())
+
+    @staticmethod
+    def format_results(search_results):
+        """
+        Format search results (or a search error) as an agent answer.
+        """
         if isinstance(search_results, dict) and "error" in search_results:
             return {"answer": "Error occurred during web search.", "details": search_results["error"]}
 